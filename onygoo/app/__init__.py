@@ -1,22 +1,39 @@
 from flask import Flask
-from .extensions import db, jwt, mail, migrate
+from .extensions import db, jwt, mail, migrate, search_cache, password_hasher, identity_cache, mail_dispatcher, push_fanout, photo_store, assets, geo_index, metrics, query_watch, replicas, scheduler
 from .blueprints.auth import auth_bp
 from .blueprints.profiles import profiles_bp
 from .blueprints.rides import rides_bp
 from .blueprints.reservations import reservations_bp
 from .blueprints.notifications import notifications_bp
 from .blueprints.admin import admin_bp
+from .commands import refresh_stats_command, recompute_ratings_command, backfill_ratings_command, index_locations_command, purge_tokens_command, build_assets_command
+from .services.stats import refresh_stats_job
+from .services.tokens import purge_expired_tokens_job
+from .services.database import engine_options, render_pool_metrics
 from config import DevelopmentConfig
 
 def create_app(config_class=DevelopmentConfig):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config, 'flask'))
 
     # Initialize extensions
+    metrics.init_app(app)
+    metrics.add_collector(render_pool_metrics)
+    query_watch.init_app(app)
     db.init_app(app)
+    replicas.init_app(app, db)
     jwt.init_app(app)
     mail.init_app(app)
+    mail_dispatcher.init_app(app)
+    push_fanout.init_app(app)
     migrate.init_app(app, db)
+    search_cache.init_app(app)
+    geo_index.init_app(app)
+    password_hasher.init_app(app)
+    identity_cache.init_app(app)
+    photo_store.init_app(app)
+    assets.init_app(app)
 
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -26,4 +43,15 @@ def create_app(config_class=DevelopmentConfig):
     app.register_blueprint(notifications_bp, url_prefix='/notifications')
     app.register_blueprint(admin_bp, url_prefix='/admin')
 
+    # CLI commands and periodic jobs
+    app.cli.add_command(refresh_stats_command)
+    app.cli.add_command(recompute_ratings_command)
+    app.cli.add_command(backfill_ratings_command)
+    app.cli.add_command(index_locations_command)
+    app.cli.add_command(purge_tokens_command)
+    app.cli.add_command(build_assets_command)
+    scheduler.add_job('refresh_stats', refresh_stats_job, app.config['STATS_REFRESH_INTERVAL'])
+    scheduler.add_job('purge_expired_tokens', purge_expired_tokens_job, app.config['TOKEN_SWEEP_INTERVAL'])
+    scheduler.init_app(app)
+
     return app
@@ -1,7 +1,11 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.extensions import db
-from app.models.models import User, Ride
+from app.extensions import db, search_cache, identity_cache, geo_index, replicas
+from app.models.models import User, Ride, UserRole
+from app.services.locations import location_key_filter, location_keys
+from app.services.pagination import apply_keyset, clamp_limit, paginate
+from app.services.stats import load_stats
+from datetime import datetime, timedelta
 from functools import wraps
 
 admin_bp = Blueprint('admin', __name__, template_folder='templates/admin')
@@ -19,23 +23,60 @@ def admin_required(fn):
     return wrapper
 
 @admin_bp.route('/dashboard')
+@replicas.reads
 @admin_required
 def dashboard():
     """
     Admin dashboard showing stats and overview.
+    Only reads the stat_counters rollup, whatever its age: it is rebuilt by
+    the refresh_stats job (SCHEDULER_ENABLED) or `flask refresh-stats`,
+    never on a page view.
     """
-    user_count = User.query.count()
-    ride_count = Ride.query.count()
-    return render_template('admin/dashboard.html', user_count=user_count, ride_count=ride_count)
+    stats, refreshed_at = load_stats(db.session)
+    max_age = timedelta(seconds=current_app.config['STATS_REFRESH_INTERVAL'])
+    return render_template(
+        'admin/dashboard.html',
+        user_count=int(stats.get('users.total', 0)),
+        ride_count=int(stats.get('rides.total', 0)),
+        stats=stats,
+        refreshed_at=refreshed_at,
+        stale=refreshed_at is None or datetime.utcnow() - refreshed_at > max_age
+    )
+
+def _list_args(sortable):
+    """
+    Parse the sort/order/limit/cursor arguments shared by the admin lists.
+    """
+    sort = request.args.get('sort', 'id')
+    if sort not in sortable:
+        sort = 'id'
+    descending = request.args.get('order', 'desc') != 'asc'
+    return sort, descending, clamp_limit(request.args.get('limit')), request.args.get('cursor')
 
 @admin_bp.route('/users')
+@replicas.reads
 @admin_required
 def manage_users():
     """
-    List and manage users.
+    List and manage users, one keyset page at a time.
+    Query parameters: role, active (1/0), email (prefix), sort (id, created_at),
+    order (asc, desc), limit, cursor.
     """
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    sort, descending, limit, cursor = _list_args(('id', 'created_at'))
+    query = User.query
+    if request.args.get('role') in UserRole.__members__:
+        query = query.filter(User.role == UserRole[request.args['role']])
+    if request.args.get('active') in ('0', '1'):
+        query = query.filter(User.is_active.is_(request.args['active'] == '1'))
+    if request.args.get('email'):
+        query = query.filter(User.email.startswith(request.args['email'], autoescape=True))
+    try:
+        query = apply_keyset(query, getattr(User, sort), User.id, cursor, limit, descending)
+    except ValueError:
+        flash('Invalid cursor', 'danger')
+        return redirect(url_for('admin.manage_users'))
+    users, next_cursor = paginate(query, limit, sort)
+    return render_template('admin/users.html', users=users, next_cursor=next_cursor)
 
 @admin_bp.route('/users/<int:user_id>/toggle_active', methods=['POST'])
 @admin_required
@@ -47,19 +88,39 @@ def toggle_user_active(user_id):
     if user:
         user.is_active = not user.is_active
         db.session.commit()
+        identity_cache.invalidate_user(user.id)
         flash('User status updated', 'success')
     else:
         flash('User not found', 'danger')
     return redirect(url_for('admin.manage_users'))
 
 @admin_bp.route('/rides')
+@replicas.reads
 @admin_required
 def manage_rides():
     """
-    List and manage rides.
+    List and manage rides, one keyset page at a time.
+    Query parameters: status, driver_id, origin, destination (prefix),
+    sort (id, departure_time), order (asc, desc), limit, cursor.
     """
-    rides = Ride.query.all()
-    return render_template('admin/rides.html', rides=rides)
+    sort, descending, limit, cursor = _list_args(('id', 'departure_time'))
+    query = Ride.query
+    if request.args.get('status'):
+        query = query.filter(Ride.status == request.args['status'])
+    if request.args.get('driver_id', type=int):
+        query = query.filter(Ride.driver_id == request.args.get('driver_id', type=int))
+    origin_keys, destination_keys = location_keys(db.session, request.args.get('origin'), request.args.get('destination'))
+    if origin_keys is not None:
+        query = query.filter(location_key_filter(Ride.origin_key, origin_keys))
+    if destination_keys is not None:
+        query = query.filter(location_key_filter(Ride.destination_key, destination_keys))
+    try:
+        query = apply_keyset(query, getattr(Ride, sort), Ride.id, cursor, limit, descending)
+    except ValueError:
+        flash('Invalid cursor', 'danger')
+        return redirect(url_for('admin.manage_rides'))
+    rides, next_cursor = paginate(query, limit, sort)
+    return render_template('admin/rides.html', rides=rides, next_cursor=next_cursor)
 
 @admin_bp.route('/rides/<int:ride_id>/cancel', methods=['POST'])
 @admin_required
@@ -70,8 +131,19 @@ def cancel_ride(ride_id):
     ride = Ride.query.get(ride_id)
     if ride:
         ride.status = 'cancelled'
+        scope = search_cache.scope_of(ride)
         db.session.commit()
+        search_cache.invalidate(scope)
+        geo_index.remove(ride_id)
         flash('Ride cancelled', 'success')
     else:
         flash('Ride not found', 'danger')
     return redirect(url_for('admin.manage_rides'))
+
+@admin_bp.route('/search_cache', methods=['GET'])
+@admin_required
+def search_cache_stats():
+    """
+    Hit/miss/eviction counters of the ride search cache.
+    """
+    return jsonify(search_cache.stats()), 200
@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify, current_app, render_template, redirect, url_for, flash
-from app.extensions import db, jwt, mail
+from app.extensions import db, jwt, mail, mail_dispatcher
+from flask_mail import Message
 from app.models.models import User, EmailVerificationToken, PasswordResetToken
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from itsdangerous import URLSafeTimedSerializer
 from datetime import datetime, timedelta
 from app.forms.auth_forms import RegistrationForm, LoginForm, RequestPasswordResetForm, ResetPasswordForm
+from app.services.hashing import HashingQueueFull
+from app.services.mailer import MailQueueFull
 import uuid
 
 auth_bp = Blueprint('auth', __name__)
@@ -40,7 +43,11 @@ def register():
             return render_template('auth/register.html', form=form)
 
         user = User(email=email, role=role)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingQueueFull:
+            flash('Server busy, please retry', 'danger')
+            return render_template('auth/register.html', form=form)
         db.session.add(user)
         db.session.commit()
 
@@ -48,7 +55,14 @@ def register():
         token = generate_token(email)
         verification_url = f"{request.host_url}auth/verify_email/{token}"
 
-        # TODO: Send email with verification_url
+        try:
+            mail_dispatcher.send(Message(
+                subject='Verify your Onygoo account',
+                recipients=[email],
+                body=f'Confirm your email address: {verification_url}'
+            ))
+        except MailQueueFull:
+            current_app.logger.warning('Mail queue full, verification email to %s not queued', email)
         flash('User registered. Please verify your email.', 'success')
         return redirect(url_for('auth.login'))
     return render_template('auth/register.html', form=form)
@@ -86,9 +100,15 @@ def login():
         password = form.password.data
 
         user = User.query.filter_by(email=email).first()
-        if not user or not user.check_password(password):
-            flash('Invalid credentials', 'danger')
+        try:
+            if not user or not user.check_password(password):
+                flash('Invalid credentials', 'danger')
+                return render_template('auth/login.html', form=form)
+        except HashingQueueFull:
+            flash('Server busy, please retry', 'danger')
             return render_template('auth/login.html', form=form)
+        # Persist a rehashed password, if check_password upgraded it
+        db.session.commit()
 
         if not user.is_email_verified:
             flash('Email not verified', 'warning')
@@ -123,7 +143,15 @@ def request_password_reset():
         db.session.commit()
 
         reset_url = f"{request.host_url}auth/reset_password/{token}"
-        # TODO: Send email with reset_url
+        try:
+            mail_dispatcher.send(Message(
+                subject='Reset your Onygoo password',
+                recipients=[email],
+                body=f'Reset your password within the next hour: {reset_url}'
+            ))
+        except MailQueueFull:
+            flash('Could not send the reset email, please retry', 'danger')
+            return render_template('auth/request_password_reset.html', form=form)
         flash('Password reset link sent to your email', 'success')
         return redirect(url_for('auth.login'))
     return render_template('auth/request_password_reset.html', form=form)
@@ -135,8 +163,11 @@ def reset_password(token):
     Renders form on GET, processes on POST.
     """
     form = ResetPasswordForm()
-    reset_token = PasswordResetToken.query.filter_by(token=token).first()
-    if not reset_token or reset_token.expires_at < datetime.utcnow():
+    reset_token = PasswordResetToken.query.filter(
+        PasswordResetToken.token == token,
+        PasswordResetToken.expires_at >= datetime.utcnow()
+    ).first()
+    if not reset_token:
         flash('Invalid or expired token', 'danger')
         return redirect(url_for('auth.request_password_reset'))
 
@@ -147,7 +178,11 @@ def reset_password(token):
             flash('User not found', 'danger')
             return redirect(url_for('auth.register'))
 
-        user.set_password(new_password)
+        try:
+            user.set_password(new_password)
+        except HashingQueueFull:
+            flash('Server busy, please retry', 'danger')
+            return render_template('auth/reset_password.html', form=form)
         db.session.delete(reset_token)
         db.session.commit()
         flash('Password reset successful', 'success')
@@ -1,15 +1,11 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
-from app.extensions import mail
+from app.extensions import mail_dispatcher, push_fanout
+from app.services.mailer import MailQueueFull
 from flask_mail import Message
-import threading
 
 notifications_bp = Blueprint('notifications', __name__)
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
-
 @notifications_bp.route('/send_email', methods=['POST'])
 @jwt_required()
 def send_email():
@@ -26,17 +22,20 @@ def send_email():
         return jsonify({'msg': 'Missing required fields'}), 400
 
     msg = Message(subject=subject, recipients=recipients, body=body)
-    threading.Thread(target=send_async_email, args=(notifications_bp.app, msg)).start()
+    try:
+        mail_dispatcher.send(msg)
+    except MailQueueFull:
+        return jsonify({'msg': 'Email queue full, retry later'}), 503
     return jsonify({'msg': 'Email sent'}), 200
 
 @notifications_bp.route('/send_push', methods=['POST'])
 @jwt_required()
 def send_push_notification():
     """
-    Send a push notification via Firebase.
-    Expects JSON with title, message, tokens (list).
+    Send a push notification to a list of device tokens.
+    Expects JSON with title, message, tokens (list), optional data (dict).
+    Returns the fan-out report with per-batch results and invalid tokens.
     """
-    # This is a placeholder. Actual Firebase integration requires firebase_admin SDK and setup.
     data = request.get_json()
     title = data.get('title')
     message = data.get('message')
@@ -45,6 +44,5 @@ def send_push_notification():
     if not title or not message or not tokens:
         return jsonify({'msg': 'Missing required fields'}), 400
 
-    # TODO: Implement Firebase push notification sending here
-
-    return jsonify({'msg': 'Push notification sent (simulated)'}), 200
+    report = push_fanout.send(tokens, title, message, data.get('data'))
+    return jsonify(report), 200
@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
+from flask import Blueprint, Response, request, jsonify, render_template, redirect, url_for, flash
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.extensions import db
+from app.extensions import db, photo_store, replicas
 from app.models.models import User, Profile, Ride, Reservation
-from werkzeug.utils import secure_filename
 from app.forms.profile_forms import ProfileForm, ProfilePhotoForm
-import os
+from app.services.photos import PhotoTooLarge, UnsupportedPhoto
+from app.services.pagination import apply_keyset, clamp_limit, paginate
+from app.services.querywatch import query_budget
+from app.services.ratings import rate_user, AlreadyRated, NotOnRide
+from datetime import datetime
+import hashlib
 
 profiles_bp = Blueprint('profiles', __name__)
 
@@ -41,8 +45,11 @@ def upload_profile_photo():
     """
     Upload or update profile photo using WTForms.
     Accepts multipart/form-data with file field 'photo'.
-    Saves file and updates photo_url in profile.
+    Stores it in photo_store under its content hash and updates the profile;
+    thumbnails are generated in the background. Bodies larger than the
+    photo limit plus multipart overhead are refused with 413 while being read.
     """
+    request.max_content_length = photo_store.max_request_bytes
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
     if not user:
@@ -51,19 +58,21 @@ def upload_profile_photo():
 
     form = ProfilePhotoForm()
     if form.validate_on_submit():
-        photo = form.photo.data
-        filename = secure_filename(photo.filename)
-        upload_folder = 'static/uploads/profile_photos'
-        os.makedirs(upload_folder, exist_ok=True)
-        filepath = os.path.join(upload_folder, filename)
-        photo.save(filepath)
+        try:
+            key = photo_store.save(form.photo.data.stream)
+        except PhotoTooLarge:
+            flash('Photo is too large', 'danger')
+            return render_template('profiles/upload_photo.html', form=form), 413
+        except UnsupportedPhoto:
+            flash('Photo must be a JPEG, PNG or WebP image', 'danger')
+            return render_template('profiles/upload_photo.html', form=form), 400
 
         if not user.profile:
-            profile = Profile(user_id=user.id, photo_url=filepath)
+            profile = Profile(user_id=user.id)
             db.session.add(profile)
             user.profile = profile
-        else:
-            user.profile.photo_url = filepath
+        user.profile.photo_key = key
+        user.profile.photo_url = photo_store.url(key)
 
         db.session.commit()
         flash('Profile photo updated', 'success')
@@ -71,7 +80,20 @@ def upload_profile_photo():
 
     return render_template('profiles/upload_photo.html', form=form)
 
+@profiles_bp.route('/<int:user_id>/photo', methods=['GET'])
+def get_user_photo(user_id):
+    """
+    Redirect to the photo of a user.
+    Query parameter: size (pixels, optional) to get the closest thumbnail.
+    """
+    profile = Profile.query.filter_by(user_id=user_id).first()
+    if not profile or not profile.photo_url:
+        return jsonify({'msg': 'Photo not found'}), 404
+    size = request.args.get('size', type=int)
+    return redirect(profile.photo_variant_url(size))
+
 @profiles_bp.route('/<int:user_id>/rating', methods=['GET'])
+@replicas.reads
 def get_user_rating(user_id):
     """
     Get the rating and rating count of a user by user_id.
@@ -85,39 +107,99 @@ def get_user_rating(user_id):
         'rating_count': profile.rating_count
     }), 200
 
+@profiles_bp.route('/<int:user_id>/rating', methods=['POST'])
+@jwt_required()
+def rate(user_id):
+    """
+    Rate a user you shared a ride with.
+    Expects JSON with ride_id and score (1 to 5).
+    """
+    data = request.get_json() or {}
+    ride_id = data.get('ride_id')
+    score = data.get('score')
+    if not isinstance(ride_id, int) or not isinstance(score, int):
+        return jsonify({'msg': 'ride_id and score are required'}), 400
+
+    try:
+        # Identities are strings in tokens; participants are int ids
+        rate_user(db.session, int(get_jwt_identity()), user_id, ride_id, score)
+    except ValueError as exc:
+        return jsonify({'msg': str(exc)}), 400
+    except NotOnRide:
+        return jsonify({'msg': 'You can only rate someone you shared this ride with'}), 403
+    except AlreadyRated:
+        return jsonify({'msg': 'Already rated this user for this ride'}), 409
+    return jsonify({'msg': 'Rating recorded'}), 201
+
 @profiles_bp.route('/me/rides', methods=['GET'])
+@replicas.reads
 @jwt_required()
+@query_budget(3)
 def get_my_ride_history():
     """
-    Get the ride history of the current logged-in user.
+    Get the ride history of the current logged-in user, newest first.
     Includes rides as driver and reservations as passenger.
+    Query parameters: from, to (ISO dates, optional), limit,
+    driver_cursor and passenger_cursor (next cursors of each list).
+    Responds 304 when If-None-Match matches the ETag of the page.
     """
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'msg': 'User not found'}), 404
-
-    # Rides as driver
-    rides = [{
-        'id': ride.id,
-        'origin': ride.origin,
-        'destination': ride.destination,
-        'departure_time': ride.departure_time.isoformat(),
-        'seats_available': ride.seats_available,
-        'status': ride.status
-    } for ride in user.rides]
-
-    # Reservations as passenger
-    reservations = [{
-        'id': res.id,
-        'ride_id': res.ride.id,
-        'origin': res.ride.origin,
-        'destination': res.ride.destination,
-        'departure_time': res.ride.departure_time.isoformat(),
-        'status': res.status.value
-    } for res in user.reservations]
+    limit = clamp_limit(request.args.get('limit'))
+    try:
+        date_from = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        date_to = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({'msg': 'Invalid date format'}), 400
 
-    return jsonify({
-        'rides_as_driver': rides,
-        'reservations_as_passenger': reservations
-    }), 200
+    # Column projections: no ORM instances and no lazy load per reservation
+    driver_query = db.session.query(
+        Ride.id, Ride.origin, Ride.destination, Ride.departure_time, Ride.seats_available, Ride.status
+    ).filter(Ride.driver_id == user_id)
+    passenger_query = db.session.query(
+        Reservation.id, Reservation.ride_id, Ride.origin, Ride.destination, Ride.departure_time, Reservation.status
+    ).join(Ride, Reservation.ride_id == Ride.id).filter(Reservation.passenger_id == user_id)
+    if date_from:
+        driver_query = driver_query.filter(Ride.departure_time >= date_from)
+        passenger_query = passenger_query.filter(Ride.departure_time >= date_from)
+    if date_to:
+        driver_query = driver_query.filter(Ride.departure_time < date_to)
+        passenger_query = passenger_query.filter(Ride.departure_time < date_to)
+
+    try:
+        driver_query = apply_keyset(driver_query, Ride.departure_time, Ride.id,
+                                    request.args.get('driver_cursor'), limit, descending=True)
+        passenger_query = apply_keyset(passenger_query, Ride.departure_time, Reservation.id,
+                                       request.args.get('passenger_cursor'), limit, descending=True)
+    except ValueError:
+        return jsonify({'msg': 'Invalid cursor'}), 400
+
+    rides, next_driver_cursor = paginate(driver_query, limit, 'departure_time')
+    reservations, next_passenger_cursor = paginate(passenger_query, limit, 'departure_time')
+
+    etag = hashlib.sha1(repr((rides, reservations, next_driver_cursor, next_passenger_cursor)).encode()).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify({
+            'rides_as_driver': [{
+                'id': ride.id,
+                'origin': ride.origin,
+                'destination': ride.destination,
+                'departure_time': ride.departure_time.isoformat(),
+                'seats_available': ride.seats_available,
+                'status': ride.status
+            } for ride in rides],
+            'next_driver_cursor': next_driver_cursor,
+            'reservations_as_passenger': [{
+                'id': res.id,
+                'ride_id': res.ride_id,
+                'origin': res.origin,
+                'destination': res.destination,
+                'departure_time': res.departure_time.isoformat(),
+                'status': res.status.value
+            } for res in reservations],
+            'next_passenger_cursor': next_passenger_cursor
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,9 +1,11 @@
 from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.extensions import db
+from app.extensions import db, search_cache
 from app.models.models import Reservation, Ride, User, Payment, ReservationStatus
 from datetime import datetime
 from app.forms.reservation_forms import ReservationForm
+from app.services.seats import reserve_seat, cancel_reservation as cancel_reservation_seat, AlreadyBooked, AlreadyCancelled, NoSeatsAvailable
+from app.services.recurring import materialize, OccurrenceNotFound
 
 reservations_bp = Blueprint('reservations', __name__)
 
@@ -14,7 +16,7 @@ def book_seat():
     Book a seat on a ride by a passenger using WTForms.
     Renders form on GET, processes form on POST.
     """
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     user = User.query.get(user_id)
     if not user or user.role.name != 'passenger':
         flash('Only passengers can book seats', 'danger')
@@ -28,29 +30,55 @@ def book_seat():
             flash('Ride not available', 'danger')
             return redirect(url_for('reservations.book_seat'))
 
-        if ride.seats_available < 1:
-            flash('No seats available', 'danger')
-            return redirect(url_for('reservations.book_seat'))
-
-        # Check if already booked
-        existing_reservation = Reservation.query.filter_by(passenger_id=user_id, ride_id=ride_id).first()
-        if existing_reservation:
+        # Seat check, decrement and duplicate check are enforced atomically by the database
+        scope = search_cache.scope_of(ride)
+        try:
+            reserve_seat(db.session, user_id, ride_id)
+        except AlreadyBooked:
             flash('Already booked this ride', 'warning')
             return redirect(url_for('reservations.book_seat'))
-
-        reservation = Reservation(
-            passenger_id=user_id,
-            ride_id=ride_id,
-            status=ReservationStatus.pending
-        )
-        db.session.add(reservation)
-        ride.seats_available -= 1
-        db.session.commit()
+        except NoSeatsAvailable:
+            flash('No seats available', 'danger')
+            return redirect(url_for('reservations.book_seat'))
+        search_cache.invalidate(scope)
         flash('Seat booked, pending confirmation', 'success')
         return redirect(url_for('reservations.book_seat'))
 
     return render_template('reservations/book_seat.html', form=form)
 
+@reservations_bp.route('/book_occurrence', methods=['POST'])
+@jwt_required()
+def book_occurrence():
+    """
+    Book a seat on an occurrence of a recurring ride, as listed by search.
+    Expects JSON with template_id and departure_time (ISO format). The
+    occurrence becomes a regular ride on its first booking.
+    """
+    user_id = int(get_jwt_identity())
+    user = User.query.get(user_id)
+    if not user or user.role.name != 'passenger':
+        return jsonify({'msg': 'Only passengers can book seats'}), 403
+
+    data = request.get_json() or {}
+    try:
+        departure_time = datetime.fromisoformat(data.get('departure_time', ''))
+    except ValueError:
+        return jsonify({'msg': 'Invalid departure_time format'}), 400
+    if not isinstance(data.get('template_id'), int):
+        return jsonify({'msg': 'template_id is required'}), 400
+
+    try:
+        ride_id = materialize(db.session, data['template_id'], departure_time)
+        reservation = reserve_seat(db.session, user_id, ride_id)
+    except OccurrenceNotFound:
+        return jsonify({'msg': 'Ride not available'}), 404
+    except AlreadyBooked:
+        return jsonify({'msg': 'Already booked this ride'}), 400
+    except NoSeatsAvailable:
+        return jsonify({'msg': 'No seats available'}), 400
+    search_cache.invalidate(search_cache.scope_of(reservation.ride))
+    return jsonify({'msg': 'Seat booked, pending confirmation', 'ride_id': ride_id, 'reservation_id': reservation.id}), 201
+
 from flask import request, jsonify, redirect, url_for, flash
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db
@@ -63,7 +91,7 @@ def confirm_reservation(reservation_id):
     """
     Confirm a reservation (simulate payment).
     """
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     reservation = Reservation.query.get(reservation_id)
     if not reservation:
         flash('Reservation not found', 'danger')
@@ -95,7 +123,7 @@ def cancel_reservation(reservation_id):
     """
     Cancel a reservation.
     """
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     reservation = Reservation.query.get(reservation_id)
     if not reservation:
         flash('Reservation not found', 'danger')
@@ -105,12 +133,12 @@ def cancel_reservation(reservation_id):
         flash('Unauthorized', 'danger')
         return redirect(url_for('reservations.book_seat'))
 
-    if reservation.status == ReservationStatus.cancelled:
+    scope = search_cache.scope_of(reservation.ride)
+    try:
+        cancel_reservation_seat(db.session, reservation)
+    except AlreadyCancelled:
         flash('Reservation already cancelled', 'warning')
         return redirect(url_for('reservations.book_seat'))
-
-    reservation.status = ReservationStatus.cancelled
-    reservation.ride.seats_available += 1
-    db.session.commit()
+    search_cache.invalidate(scope)
     flash('Reservation cancelled successfully', 'success')
     return redirect(url_for('reservations.book_seat'))
@@ -1,9 +1,21 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
+from flask import Blueprint, Response, current_app, request, jsonify, render_template, redirect, url_for, flash, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.extensions import db
-from app.models.models import Ride, User
-from datetime import datetime
+from app.extensions import db, search_cache, geo_index, replicas
+from app.models.models import Ride, RideTemplate, RideTemplateException, User
+from datetime import datetime, timedelta
 from app.forms.ride_forms import RideForm
+from app.services.querywatch import query_budget
+from app.services.locations import location_key_filter, location_keys, normalize_location
+from app.services.ride_import import import_format, import_rides
+from app.services.recurring import (
+    RIDE_COLUMNS, RideTemplateBase, merge_rides, ride_record, search_occurrences, search_window, weekday_list,
+    weekday_mask
+)
+from app.services.serialization import dumps
+from pydantic import ValidationError
+from app.services.pagination import (
+    STREAM_CHUNK_SIZE, apply_keyset, clamp_limit, iter_json_array, paginate
+)
 
 rides_bp = Blueprint('rides', __name__)
 
@@ -29,63 +41,162 @@ def propose_ride():
             departure_time=form.departure_time.data,
             seats_available=form.seats_available.data,
             price_per_seat=form.price_per_seat.data,
+            origin_lat=form.origin_lat.data,
+            origin_lon=form.origin_lon.data,
+            destination_lat=form.destination_lat.data,
+            destination_lon=form.destination_lon.data,
             status='active'
         )
         db.session.add(ride)
+        scope = search_cache.scope_of(ride)
+        entry = geo_index.entry_of(ride)
         db.session.commit()
+        search_cache.invalidate(scope)
+        geo_index.put(ride.id, entry)
         flash('Ride proposed successfully', 'success')
         return redirect(url_for('rides.propose_ride'))
 
     return render_template('rides/propose_ride.html', form=form)
 
+@rides_bp.route('/import', methods=['POST'])
+@jwt_required()
+def import_rides_bulk():
+    """
+    Bulk import rides of the current driver from a CSV (with header) or
+    NDJSON body, one ride per line. The format comes from the Content-Type
+    or the format query parameter. The body is streamed and inserted in
+    one transaction; invalid lines are reported and skipped.
+    """
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    if not user or user.role.name != 'driver':
+        return jsonify({'msg': 'Only drivers can propose rides'}), 403
+
+    fmt = import_format(request.content_type, request.args.get('format'))
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'msg': 'Send text/csv or application/x-ndjson'}), 415
+
+    try:
+        report = import_rides(db.session, user.id, request.stream, fmt)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    if report['imported']:
+        # Too many scopes to invalidate one by one
+        search_cache.clear()
+        geo_index.invalidate()
+    return jsonify(report), 200
+
 @rides_bp.route('/search', methods=['GET'])
+@replicas.reads
+@query_budget(5)
 def search_rides():
     """
     Search for rides by origin, destination, and optional date.
-    Query parameters: origin, destination, date (ISO format, optional)
+    Query parameters: origin, destination, date (ISO format, optional),
+    limit and cursor (keyset pagination on departure_time, id),
+    stream=1 to stream every match as a JSON array instead of paging.
+    Upcoming occurrences of recurring rides are included with id null and
+    their template_id; book them through /reservations/book_occurrence.
     """
     origin = request.args.get('origin')
     destination = request.args.get('destination')
     date_str = request.args.get('date')
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream', '').lower() in ('1', 'true')
 
     if not origin or not destination:
         return jsonify({'msg': 'Origin and destination are required'}), 400
 
-    query = Ride.query.filter(
-        Ride.origin.ilike(f'%{origin}%'),
-        Ride.destination.ilike(f'%{destination}%'),
-        Ride.status == 'active'
-    )
-
+    day_start = day_end = None
     if date_str:
         try:
-            date = datetime.fromisoformat(date_str).date()
-            query = query.filter(db.func.date(Ride.departure_time) == date)
+            day_start = datetime.combine(datetime.fromisoformat(date_str).date(), datetime.min.time())
         except ValueError:
             return jsonify({'msg': 'Invalid date format'}), 400
+        day_end = day_start + timedelta(days=1)
 
-    rides = query.all()
-    results = []
-    for ride in rides:
-        results.append({
-            'id': ride.id,
-            'driver_id': ride.driver_id,
-            'origin': ride.origin,
-            'destination': ride.destination,
-            'departure_time': ride.departure_time.isoformat(),
-            'seats_available': ride.seats_available,
-            'price_per_seat': ride.price_per_seat,
-            'status': ride.status
-        })
-
-    return jsonify(results), 200
+    limit = None if stream else clamp_limit(request.args.get('limit'))
+    if not stream:
+        cache_key = search_cache.make_key(
+            normalize_location(origin), normalize_location(destination), day_start, day_end, cursor, limit
+        )
+        body = search_cache.get(cache_key)
+        if body is not None:
+            return Response(body, mimetype='application/json')
+
+    origin_keys, destination_keys = location_keys(db.session, origin, destination)
+    # Column tuples, not ORM instances: nothing to hydrate or track per row
+    query = db.session.query(*RIDE_COLUMNS).filter(
+        location_key_filter(Ride.origin_key, origin_keys),
+        location_key_filter(Ride.destination_key, destination_keys),
+        Ride.status == 'active'
+    )
+    if day_start:
+        # Range on departure_time instead of DATE(departure_time) so the index stays usable
+        query = query.filter(Ride.departure_time >= day_start, Ride.departure_time < day_end)
+    try:
+        query = apply_keyset(query, Ride.departure_time, Ride.id, cursor, limit)
+    except ValueError:
+        return jsonify({'msg': 'Invalid cursor'}), 400
+
+    # Recurring rides are expanded in the searched window and merged in departure order
+    start, end = search_window(day_start, day_end, current_app.config['RECURRING_SEARCH_DAYS'])
+    occurrences = search_occurrences(db.session, origin_keys, destination_keys, start, end, cursor, limit)
+
+    if stream:
+        rows = merge_rides(query.yield_per(STREAM_CHUNK_SIZE), occurrences)
+        return Response(stream_with_context(iter_json_array(rows, ride_record)), mimetype='application/json')
+
+    rides, next_cursor = paginate(merge_rides(query, occurrences), limit, 'departure_time')
+    body = dumps({
+        'rides': [ride_record(ride) for ride in rides],
+        'next_cursor': next_cursor
+    })
+    search_cache.set(cache_key, body)
+    return Response(body, mimetype='application/json')
+
+@rides_bp.route('/nearby', methods=['GET'])
+@query_budget(3)
+def search_nearby_rides():
+    """
+    Search for rides leaving near a point and arriving near another.
+    Query parameters: origin_lat, origin_lon, destination_lat,
+    destination_lon, radius_km (default 5), from and to (ISO datetimes,
+    optional) and limit. Only rides proposed with coordinates are found.
+    """
+    try:
+        origin = (float(request.args['origin_lat']), float(request.args['origin_lon']))
+        destination = (float(request.args['destination_lat']), float(request.args['destination_lon']))
+        radius_km = float(request.args.get('radius_km', 5))
+        date_from = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        date_to = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except (KeyError, ValueError):
+        return jsonify({'msg': 'origin_lat, origin_lon, destination_lat and destination_lon are required'}), 400
+    if not 0 < radius_km <= current_app.config['GEO_MAX_RADIUS_KM']:
+        return jsonify({'msg': 'Invalid radius'}), 400
+    limit = clamp_limit(request.args.get('limit'))
+
+    geo_index.ensure_loaded(db.session)
+    matches = geo_index.search(origin, destination, radius_km, date_from or datetime.utcnow(), date_to)[:limit]
+    # The index may lag other processes: the database has the final say
+    rides = {
+        ride.id: ride for ride in
+        Ride.query.filter(Ride.id.in_([ride_id for ride_id, _, _ in matches]), Ride.status == 'active')
+    } if matches else {}
+    return jsonify({'rides': [
+        dict(rides[ride_id].to_dict(), origin_distance_km=origin_km, destination_distance_km=destination_km)
+        for ride_id, origin_km, destination_km in matches if ride_id in rides
+    ]}), 200
 
 @rides_bp.route('/<int:ride_id>', methods=['PUT'])
 @jwt_required()
 def modify_ride(ride_id):
     """
     Modify an existing ride by the driver.
-    Expects JSON with any of origin, destination, departure_time, seats_available, price_per_seat, status.
+    Expects JSON with any of origin, destination, departure_time, seats_available, price_per_seat, status,
+    origin_lat, origin_lon, destination_lat, destination_lon.
     """
     user_id = get_jwt_identity()
     ride = Ride.query.get(ride_id)
@@ -96,6 +207,7 @@ def modify_ride(ride_id):
         return jsonify({'msg': 'Unauthorized'}), 403
 
     data = request.get_json()
+    previous_scope = search_cache.scope_of(ride)
     if 'origin' in data:
         ride.origin = data['origin']
     if 'destination' in data:
@@ -111,8 +223,15 @@ def modify_ride(ride_id):
         ride.price_per_seat = data['price_per_seat']
     if 'status' in data:
         ride.status = data['status']
+    for field in ('origin_lat', 'origin_lon', 'destination_lat', 'destination_lon'):
+        if field in data:
+            setattr(ride, field, data[field])
 
+    scope = search_cache.scope_of(ride)
+    entry = geo_index.entry_of(ride)
     db.session.commit()
+    search_cache.invalidate(previous_scope, scope)
+    geo_index.put(ride_id, entry)
     return jsonify({'msg': 'Ride updated successfully'}), 200
 
 @rides_bp.route('/<int:ride_id>', methods=['DELETE'])
@@ -130,5 +249,99 @@ def cancel_ride(ride_id):
         return jsonify({'msg': 'Unauthorized'}), 403
 
     ride.status = 'cancelled'
+    scope = search_cache.scope_of(ride)
     db.session.commit()
+    search_cache.invalidate(scope)
+    geo_index.remove(ride_id)
     return jsonify({'msg': 'Ride cancelled successfully'}), 200
+
+def _template_to_dict(template):
+    return {
+        'id': template.id,
+        'origin': template.origin,
+        'destination': template.destination,
+        'departure_time': template.departure_time.isoformat(),
+        'weekdays': weekday_list(template.weekdays),
+        'valid_from': template.valid_from.isoformat(),
+        'valid_until': template.valid_until.isoformat() if template.valid_until else None,
+        'seats_available': template.seats_available,
+        'price_per_seat': template.price_per_seat,
+        'status': template.status,
+        'exceptions': sorted(exception.date.isoformat() for exception in template.exceptions)
+    }
+
+@rides_bp.route('/templates', methods=['POST'])
+@jwt_required()
+def create_ride_template():
+    """
+    Create a recurring ride.
+    Expects JSON with origin, destination, departure_time (HH:MM), weekdays
+    (list, Monday = 0), valid_from, valid_until (optional), seats_available
+    and price_per_seat.
+    """
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+    if not user or user.role.name != 'driver':
+        return jsonify({'msg': 'Only drivers can propose rides'}), 403
+
+    try:
+        data = RideTemplateBase(**(request.get_json() or {}))
+    except ValidationError as exc:
+        return jsonify({'msg': 'Invalid ride template', 'errors': exc.errors()}), 400
+    template = RideTemplate(
+        driver_id=user.id,
+        origin=data.origin,
+        destination=data.destination,
+        departure_time=data.departure_time,
+        weekdays=weekday_mask(data.weekdays),
+        valid_from=data.valid_from,
+        valid_until=data.valid_until,
+        seats_available=data.seats_available,
+        price_per_seat=data.price_per_seat,
+        status='active'
+    )
+    db.session.add(template)
+    db.session.commit()
+    # A template touches every date of its range, so scoped invalidation does not pay off
+    search_cache.clear()
+    return jsonify(_template_to_dict(template)), 201
+
+@rides_bp.route('/templates/<int:template_id>/exceptions', methods=['POST'])
+@jwt_required()
+def add_ride_template_exception(template_id):
+    """
+    Skip one date of a recurring ride.
+    Expects JSON with date (ISO format).
+    """
+    template = RideTemplate.query.get(template_id)
+    if not template:
+        return jsonify({'msg': 'Ride template not found'}), 404
+    if template.driver_id != get_jwt_identity():
+        return jsonify({'msg': 'Unauthorized'}), 403
+    try:
+        day = datetime.fromisoformat((request.get_json() or {}).get('date', '')).date()
+    except ValueError:
+        return jsonify({'msg': 'Invalid date format'}), 400
+
+    if day not in {exception.date for exception in template.exceptions}:
+        template.exceptions.append(RideTemplateException(date=day))
+        db.session.commit()
+        search_cache.clear()
+    return jsonify(_template_to_dict(template)), 200
+
+@rides_bp.route('/templates/<int:template_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_ride_template(template_id):
+    """
+    Stop a recurring ride. Occurrences already booked stay as regular rides.
+    """
+    template = RideTemplate.query.get(template_id)
+    if not template:
+        return jsonify({'msg': 'Ride template not found'}), 404
+    if template.driver_id != get_jwt_identity():
+        return jsonify({'msg': 'Unauthorized'}), 403
+
+    template.status = 'cancelled'
+    db.session.commit()
+    search_cache.clear()
+    return jsonify({'msg': 'Ride template cancelled successfully'}), 200
@@ -0,0 +1,68 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.extensions import db, assets
+from app.services.locations import index_location_keys
+from app.services.ratings import backfill_rating_sums, recompute_ratings
+from app.services.stats import refresh_stats
+from app.services.tokens import purge_expired_tokens
+
+@click.command('refresh-stats')
+@with_appcontext
+def refresh_stats_command():
+    """
+    Recompute the admin dashboard statistics rollup.
+    """
+    stats = refresh_stats(db.session)
+    for name in sorted(stats):
+        click.echo(f'{name}: {stats[name]:g}')
+
+@click.command('recompute-ratings')
+@with_appcontext
+def recompute_ratings_command():
+    """
+    Rebuild every profile rating aggregate from the ratings table.
+    """
+    rated = recompute_ratings(db.session)
+    click.echo(f'Recomputed ratings of {rated} users')
+
+@click.command('backfill-ratings')
+@with_appcontext
+def backfill_ratings_command():
+    """
+    Fill profiles.rating_sum from rating * rating_count for profiles rated
+    before the column was added. Run once after adding the column.
+    """
+    fixed = backfill_rating_sums(db.session)
+    click.echo(f'Backfilled rating sums of {fixed} profiles')
+
+@click.command('index-locations')
+@with_appcontext
+def index_locations_command():
+    """
+    Make the location keys of every ride and ride template searchable.
+    Run once after creating location_tokens on an existing database.
+    """
+    indexed = index_location_keys(db.session.connection())
+    db.session.commit()
+    click.echo(f'Indexed {indexed} location keys')
+
+@click.command('purge-tokens')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+@with_appcontext
+def purge_tokens_command(batch_size):
+    """
+    Delete expired email verification and password reset tokens.
+    """
+    purged = purge_expired_tokens(db.session, batch_size or current_app.config['TOKEN_SWEEP_BATCH_SIZE'])
+    for table in sorted(purged):
+        click.echo(f'{table}: {purged[table]} purged')
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """
+    Fingerprint and precompress the static files into ASSETS_FOLDER.
+    """
+    manifest = assets.build()
+    click.echo(f'Built {len(manifest)} assets into {assets.folder}')
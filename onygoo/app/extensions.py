@@ -2,8 +2,32 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 from flask_migrate import Migrate
+from app.services.assets import Assets
+from app.services.cache import SearchCache
+from app.services.geo import GeoIndex
+from app.services.hashing import PasswordHasher
+from app.services.identity import IdentityCache
+from app.services.mailer import MailDispatcher
+from app.services.metrics import Metrics
+from app.services.photos import PhotoStore
+from app.services.push import PushFanout
+from app.services.querywatch import QueryWatch
+from app.services.replicas import Replicas
+from app.services.scheduler import Scheduler
 
 db = SQLAlchemy()
 jwt = JWTManager()
 mail = Mail()
 migrate = Migrate()
+search_cache = SearchCache()
+password_hasher = PasswordHasher()
+identity_cache = IdentityCache()
+mail_dispatcher = MailDispatcher(mail)
+push_fanout = PushFanout()
+scheduler = Scheduler()
+photo_store = PhotoStore()
+assets = Assets()
+geo_index = GeoIndex()
+metrics = Metrics()
+query_watch = QueryWatch()
+replicas = Replicas()
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, DateTimeField, IntegerField, FloatField, SubmitField
-from wtforms.validators import DataRequired, Length, NumberRange
+from wtforms.validators import DataRequired, Length, NumberRange, Optional
 
 class RideForm(FlaskForm):
     origin = StringField('Origin', validators=[DataRequired(), Length(max=255)])
@@ -8,4 +8,8 @@ class RideForm(FlaskForm):
     departure_time = DateTimeField('Departure Time', format='%Y-%m-%d %H:%M:%S', validators=[DataRequired()])
     seats_available = IntegerField('Seats Available', validators=[DataRequired(), NumberRange(min=1)])
     price_per_seat = FloatField('Price per Seat', validators=[DataRequired(), NumberRange(min=0)])
+    origin_lat = FloatField('Origin Latitude', validators=[Optional(), NumberRange(min=-90, max=90)])
+    origin_lon = FloatField('Origin Longitude', validators=[Optional(), NumberRange(min=-180, max=180)])
+    destination_lat = FloatField('Destination Latitude', validators=[Optional(), NumberRange(min=-90, max=90)])
+    destination_lon = FloatField('Destination Longitude', validators=[Optional(), NumberRange(min=-180, max=180)])
     submit = SubmitField('Propose Ride')
@@ -1,8 +1,8 @@
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy.orm import relationship
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float, Enum
-from app.extensions import db
+from sqlalchemy.orm import relationship, validates
+from sqlalchemy import Column, Integer, String, Date, DateTime, Time, ForeignKey, Boolean, Float, Enum, Index, UniqueConstraint, event, inspect
+from app.extensions import db, password_hasher, photo_store
+from app.services.locations import normalize_location, register_location_keys
 import enum
 
 class UserRole(enum.Enum):
@@ -19,16 +19,26 @@ class User(db.Model):
     is_active = Column(Boolean, default=True)
     is_email_verified = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Maintained incrementally by app.services.notifications; read for the app badge
+    unread_notifications = Column(Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        Index('ix_users_created_at', 'created_at'),
+    )
 
     profile = relationship('Profile', uselist=False, back_populates='user')
     rides = relationship('Ride', back_populates='driver')
     reservations = relationship('Reservation', back_populates='passenger')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Upgrades the stored hash in place when the cost factor changed; the caller commits
+        matches, new_hash = password_hasher.verify(password, self.password_hash)
+        if new_hash:
+            self.password_hash = new_hash
+        return matches
 
 class Profile(db.Model):
     __tablename__ = 'profiles'
@@ -37,15 +47,22 @@ class Profile(db.Model):
     full_name = Column(String(100))
     phone_number = Column(String(20))
     photo_url = Column(String(255))
+    # '<sha256>.<ext>' of the photo in photo_store, None for legacy uploads
+    photo_key = Column(String(80))
+    # Aggregates of the ratings table, maintained by app.services.ratings
     rating = Column(Float, default=0.0)
+    rating_sum = Column(Float, nullable=False, default=0.0, server_default='0')
     rating_count = Column(Integer, default=0)
 
     user = relationship('User', back_populates='profile')
 
-    def update_rating(self, new_rating):
-        total_rating = self.rating * self.rating_count
-        self.rating_count += 1
-        self.rating = (total_rating + new_rating) / self.rating_count
+    def photo_variant_url(self, size=None):
+        """
+        URL of the photo thumbnail closest to `size` pixels (the original if None).
+        """
+        if not self.photo_key:
+            return self.photo_url
+        return photo_store.url(self.photo_key, size)
 
 class Ride(db.Model):
     __tablename__ = 'rides'
@@ -57,10 +74,120 @@ class Ride(db.Model):
     seats_available = Column(Integer, nullable=False)
     price_per_seat = Column(Float, nullable=False)
     status = Column(String(50), default='active')  # active, cancelled, completed
+    # Normalized copies of origin/destination used by search (see app.services.locations)
+    origin_key = Column(String(255), nullable=False, default='')
+    destination_key = Column(String(255), nullable=False, default='')
+    # Set when the ride is a materialized occurrence of a RideTemplate
+    template_id = Column(Integer, ForeignKey('ride_templates.id'))
+    # Optional coordinates for radius search (see app.services.geo)
+    origin_lat = Column(Float)
+    origin_lon = Column(Float)
+    destination_lat = Column(Float)
+    destination_lon = Column(Float)
 
     driver = relationship('User', back_populates='rides')
     reservations = relationship('Reservation', back_populates='ride')
 
+    __table_args__ = (
+        Index('ix_rides_search', 'origin_key', 'destination_key', 'status', 'departure_time'),
+        Index('ix_rides_driver_departure', 'driver_id', 'departure_time'),
+        Index('ix_rides_status_departure', 'status', 'departure_time'),
+        # One ride per occurrence, even when two first bookings race
+        UniqueConstraint('template_id', 'departure_time', name='uq_rides_template_departure'),
+    )
+
+    @validates('origin', 'destination')
+    def _sync_location_key(self, key, value):
+        setattr(self, key + '_key', normalize_location(value))
+        return value
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'driver_id': self.driver_id,
+            'origin': self.origin,
+            'destination': self.destination,
+            'departure_time': self.departure_time.isoformat(),
+            'seats_available': self.seats_available,
+            'price_per_seat': self.price_per_seat,
+            'status': self.status,
+            'template_id': self.template_id,
+            'origin_lat': self.origin_lat,
+            'origin_lon': self.origin_lon,
+            'destination_lat': self.destination_lat,
+            'destination_lon': self.destination_lon
+        }
+
+class RideTemplate(db.Model):
+    """
+    A ride repeated every week on the days of `weekdays` (bit 0 = Monday)
+    at departure_time, between valid_from and valid_until. Occurrences are
+    expanded on demand by app.services.recurring and only become Ride rows
+    when their first seat is booked.
+    """
+    __tablename__ = 'ride_templates'
+    id = Column(Integer, primary_key=True)
+    driver_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    origin = Column(String(255), nullable=False)
+    destination = Column(String(255), nullable=False)
+    origin_key = Column(String(255), nullable=False, default='')
+    destination_key = Column(String(255), nullable=False, default='')
+    departure_time = Column(Time, nullable=False)
+    weekdays = Column(Integer, nullable=False)
+    valid_from = Column(Date, nullable=False)
+    valid_until = Column(Date)
+    seats_available = Column(Integer, nullable=False)
+    price_per_seat = Column(Float, nullable=False)
+    status = Column(String(50), default='active')  # active, cancelled
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    driver = relationship('User')
+    exceptions = relationship('RideTemplateException', back_populates='template', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        Index('ix_ride_templates_search', 'origin_key', 'destination_key', 'status'),
+    )
+
+    @validates('origin', 'destination')
+    def _sync_location_key(self, key, value):
+        setattr(self, key + '_key', normalize_location(value))
+        return value
+
+class LocationToken(db.Model):
+    """
+    Every suffix starting at a token of each distinct location key in use
+    ('etienne gare' -> 'saint etienne gare'), so location searches find
+    keys by prefix here and then seek the search indexes by key.
+    """
+    __tablename__ = 'location_tokens'
+    token = Column(String(255), primary_key=True)
+    key = Column(String(255), primary_key=True)
+
+def _register_location_keys(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.origin_key.history.has_changes() or state.attrs.destination_key.history.has_changes():
+        register_location_keys(connection, (target.origin_key, target.destination_key))
+
+event.listen(Ride, 'after_insert', _register_location_keys)
+event.listen(Ride, 'after_update', _register_location_keys)
+event.listen(RideTemplate, 'after_insert', _register_location_keys)
+event.listen(RideTemplate, 'after_update', _register_location_keys)
+
+class RideTemplateException(db.Model):
+    """
+    A date on which a RideTemplate does not run.
+    """
+    __tablename__ = 'ride_template_exceptions'
+    id = Column(Integer, primary_key=True)
+    template_id = Column(Integer, ForeignKey('ride_templates.id'), nullable=False)
+    date = Column(Date, nullable=False)
+
+    template = relationship('RideTemplate', back_populates='exceptions')
+
+    __table_args__ = (
+        UniqueConstraint('template_id', 'date', name='uq_ride_template_exceptions_date'),
+    )
+
 class ReservationStatus(enum.Enum):
     pending = "pending"
     confirmed = "confirmed"
@@ -77,6 +204,10 @@ class Reservation(db.Model):
     passenger = relationship('User', back_populates='reservations')
     ride = relationship('Ride', back_populates='reservations')
 
+    __table_args__ = (
+        UniqueConstraint('passenger_id', 'ride_id', name='uq_reservations_passenger_ride'),
+    )
+
 class Payment(db.Model):
     __tablename__ = 'payments'
     id = Column(Integer, primary_key=True)
@@ -87,13 +218,48 @@ class Payment(db.Model):
 
     reservation = relationship('Reservation')
 
+class Notification(db.Model):
+    __tablename__ = 'notifications'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    title = Column(String(255), nullable=False)
+    message = Column(String(1000), nullable=False)
+    is_read = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    read_at = Column(DateTime)
+
+    user = relationship('User')
+
+    __table_args__ = (
+        Index('ix_notifications_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+class Rating(db.Model):
+    __tablename__ = 'ratings'
+    id = Column(Integer, primary_key=True)
+    rater_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    ratee_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    ride_id = Column(Integer, ForeignKey('rides.id'), nullable=False)
+    score = Column(Integer, nullable=False)  # 1 to 5
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('rater_id', 'ratee_id', 'ride_id', name='uq_ratings_rater_ratee_ride'),
+    )
+
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counters'
+    name = Column(String(100), primary_key=True)  # e.g. 'rides.status.active'
+    value = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
 class EmailVerificationToken(db.Model):
     __tablename__ = 'email_verification_tokens'
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'))
     token = Column(String(255), unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
     user = relationship('User')
 
@@ -103,6 +269,6 @@ class PasswordResetToken(db.Model):
     user_id = Column(Integer, ForeignKey('users.id'))
     token = Column(String(255), unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
 
     user = relationship('User')
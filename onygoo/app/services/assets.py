@@ -0,0 +1,137 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only text assets are worth precompressing; images and fonts already are
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.html', '.txt', '.map')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+def _write_atomic(path, content):
+    """
+    Write bytes to path through a temporary file of its own in the same
+    folder, so concurrent builders never share or truncate a half-written file.
+    """
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+def build_assets(static_folder, output_folder, skip=()):
+    """
+    Copy every file of static_folder to output_folder under a content-hashed
+    name (css/style.css -> css/style.<hash>.css), next to .gz and .br
+    variants for text files. Existing outputs are reused, so rebuilding an
+    unchanged tree only hashes. Returns the manifest {name: hashed name},
+    which is also written to output_folder/manifest.json.
+    """
+    manifest = {}
+    skip = {os.path.abspath(path) for path in skip} | {os.path.abspath(output_folder)}
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) not in skip]
+        for filename in files:
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            stem, extension = os.path.splitext(name)
+            hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+            manifest[name] = hashed
+
+            target = os.path.join(output_folder, hashed)
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            variants = [(target, data)]
+            if extension in COMPRESSIBLE:
+                variants.append((target + '.gz', gzip.compress(data, compresslevel=9, mtime=0)))
+                if brotli is not None:
+                    variants.append((target + '.br', brotli.compress(data)))
+            # The uncompressed file goes last: its presence marks the set complete
+            for path, content in reversed(variants):
+                _write_atomic(path, content)
+
+    os.makedirs(output_folder, exist_ok=True)
+    _write_atomic(os.path.join(output_folder, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+class Assets:
+    """
+    Serves fingerprinted static files. At startup (or via `flask build-assets`)
+    the static folder is hashed into ASSETS_FOLDER; templates link to them with
+    asset_url('css/style.css'), which resolves to /assets/css/style.<hash>.css.
+    Those URLs change whenever the content does, so they are served with an
+    immutable Cache-Control and the browser never revalidates them. Files not
+    in the manifest fall back to the regular static URL.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.folder = None
+        self.manifest = {}
+        self._served = set()
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = app.config['ASSETS_FOLDER']
+        if app.config.get('ASSETS_BUILD_ON_STARTUP', True):
+            self.build()
+        else:
+            self.load()
+
+        def asset_url(filename, **values):
+            hashed = self.manifest.get(filename)
+            if hashed is None:
+                return url_for('static', filename=filename, **values)
+            return url_for('assets', filename=hashed, **values)
+
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = asset_url
+
+    def build(self):
+        skip = [self.app.config[key] for key in ('PHOTO_UPLOAD_FOLDER',) if self.app.config.get(key)]
+        self.manifest = build_assets(self.app.static_folder, self.folder, skip=skip)
+        self._served = set(self.manifest.values())
+        return self.manifest
+
+    def load(self):
+        try:
+            with open(os.path.join(self.folder, 'manifest.json')) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self._served = set(self.manifest.values())
+        return self.manifest
+
+    def serve(self, filename):
+        # Only manifest entries are served, which also rules out path traversal
+        if filename not in self._served:
+            abort(404)
+        path = os.path.join(self.folder, filename)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.exists(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+        response = send_file(path, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
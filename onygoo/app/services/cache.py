@@ -0,0 +1,311 @@
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from app.services.locations import location_key_matches
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+    This is the default in-process store of SearchCache; a shared store
+    (e.g. a Redis wrapper) can be used instead as long as it implements
+    get/set/delete/keys/clear.
+    """
+
+    def __init__(self, maxsize=1024, ttl=120):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class RedisStore:
+    """
+    Store shared by every Flask worker and the FastAPI app, so that an
+    invalidation in one process is seen by all of them. Implements the
+    get/set/delete/keys/clear contract of TTLCache; keys are JSON values,
+    values are pickled and expire after `ttl` seconds.
+    """
+
+    def __init__(self, url, namespace, ttl=120):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = f'onygoo:{namespace}:'
+        self.ttl = ttl
+
+    def _name(self, key):
+        return self.prefix + json.dumps(key)
+
+    def get(self, key):
+        raw = self.client.get(self._name(key))
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        if self.ttl > 0:
+            self.client.set(self._name(key), pickle.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self._name(key))
+
+    def _names(self):
+        return list(self.client.scan_iter(match=self.prefix + '*'))
+
+    def keys(self):
+        return [json.loads(name.decode()[len(self.prefix):]) for name in self._names()]
+
+    def clear(self):
+        names = self._names()
+        if names:
+            self.client.delete(*names)
+
+class KeyIndex:
+    """
+    In-process index from a group of cache keys, e.g. the (origin_key,
+    destination_key) of cached searches, to the keys stored under it, so
+    invalidation only looks at the groups it affects. Members are forgotten
+    after `ttl` seconds, like the entries they point to.
+    """
+
+    def __init__(self, ttl=120):
+        self.ttl = ttl
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prune(members, now):
+        # Members are kept in expiry order since they all live for `ttl`
+        while members and next(iter(members.values())) <= now:
+            members.popitem(last=False)
+
+    def add(self, group, key):
+        now = time.monotonic()
+        with self._lock:
+            members = self._groups.setdefault(group, OrderedDict())
+            members[key] = now + self.ttl
+            members.move_to_end(key)
+            self._prune(members, now)
+
+    def groups(self):
+        now = time.monotonic()
+        with self._lock:
+            for group, members in list(self._groups.items()):
+                self._prune(members, now)
+                if not members:
+                    del self._groups[group]
+            return list(self._groups)
+
+    def members(self, group):
+        now = time.monotonic()
+        with self._lock:
+            members = self._groups.get(group, {})
+            return [key for key, expires_at in members.items() if expires_at > now]
+
+    def discard(self, group, keys):
+        with self._lock:
+            members = self._groups.get(group)
+            if members is None:
+                return
+            for key in keys:
+                members.pop(key, None)
+            if not members:
+                del self._groups[group]
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+
+class RedisKeyIndex:
+    """
+    KeyIndex shared through Redis, next to a RedisStore: each group is a
+    sorted set of keys scored by expiry time, and the groups themselves are
+    listed in another one.
+    """
+
+    def __init__(self, client, namespace, ttl=120):
+        self.client = client
+        self.prefix = f'onygoo:{namespace}:'
+        self.groups_name = self.prefix + 'groups'
+        self.ttl = ttl
+
+    def _name(self, group):
+        return self.prefix + json.dumps(group)
+
+    def add(self, group, key):
+        now = time.time()
+        name = self._name(group)
+        pipeline = self.client.pipeline()
+        pipeline.zadd(name, {key: now + self.ttl})
+        pipeline.zremrangebyscore(name, '-inf', now)
+        pipeline.expire(name, max(int(self.ttl), 1))
+        pipeline.zadd(self.groups_name, {json.dumps(group): now + self.ttl})
+        pipeline.zremrangebyscore(self.groups_name, '-inf', now)
+        pipeline.execute()
+
+    def groups(self):
+        return [tuple(json.loads(group)) for group in self.client.zrangebyscore(self.groups_name, time.time(), '+inf')]
+
+    def members(self, group):
+        return [key.decode() for key in self.client.zrangebyscore(self._name(group), time.time(), '+inf')]
+
+    def discard(self, group, keys):
+        if keys:
+            self.client.zrem(self._name(group), *keys)
+
+    def clear(self):
+        names = list(self.client.scan_iter(match=self.prefix + '*'))
+        if names:
+            self.client.delete(*names)
+
+class SearchCache:
+    """
+    Cache of ride search result pages keyed on the normalized search parameters.
+    Entries are invalidated by scope: a change to a ride drops every cached
+    search whose origin/destination prefix and date range would include it.
+    With the default per-process store, invalidations do not reach other
+    processes: a change made through Flask shows up in FastAPI searches
+    (and other workers) after at most SEARCH_CACHE_TTL seconds. Set
+    CACHE_REDIS_URL to share one store between them. Keys are indexed by
+    their (origin_key, destination_key) so that invalidation does not scan
+    the whole store.
+    """
+
+    def __init__(self, store=None, maxsize=1024, ttl=120):
+        self.store = store or TTLCache(maxsize, ttl)
+        self.index = KeyIndex(ttl)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        ttl = config.get('SEARCH_CACHE_TTL', 120)
+        if config.get('SEARCH_CACHE_STORE') is not None:
+            self.store = config['SEARCH_CACHE_STORE']
+            self.index = KeyIndex(ttl)
+        elif config.get('CACHE_REDIS_URL'):
+            self.store = RedisStore(config['CACHE_REDIS_URL'], 'search', ttl)
+            self.index = RedisKeyIndex(self.store.client, 'search-index', ttl)
+        else:
+            self.store = TTLCache(config.get('SEARCH_CACHE_SIZE', 1024), ttl)
+            self.index = KeyIndex(ttl)
+
+    @staticmethod
+    def make_key(origin_key, destination_key, date_from=None, date_to=None, cursor=None, limit=None):
+        return json.dumps([
+            origin_key, destination_key,
+            date_from.isoformat() if date_from else None,
+            date_to.isoformat() if date_to else None,
+            cursor, limit
+        ])
+
+    @staticmethod
+    def scope_of(ride):
+        """
+        The part of a ride that decides which searches can return it.
+        Capture it before commit: committed instances are expired.
+        """
+        return ride.origin_key, ride.destination_key, ride.departure_time
+
+    def get(self, key):
+        value = self.store.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.store.set(key, value)
+        self.index.add(tuple(json.loads(key)[:2]), key)
+
+    def invalidate(self, *scopes):
+        """
+        Drop every cached search that could contain a ride with one of the
+        given (origin_key, destination_key, departure_time) scopes. Only the
+        keys indexed under a matching origin/destination pair are looked at.
+        """
+        dropped = 0
+        for group in self.index.groups():
+            origin_key, destination_key = group
+            # An empty key is a search without that filter (FastAPI) or one matching nothing
+            departures = [
+                departure_time for ride_origin, ride_destination, departure_time in scopes
+                if (not origin_key or location_key_matches(ride_origin, origin_key))
+                and (not destination_key or location_key_matches(ride_destination, destination_key))
+            ]
+            if not departures:
+                continue
+            stale = []
+            for key in self.index.members(group):
+                date_from, date_to = json.loads(key)[2:4]
+                date_from = date_from and datetime.fromisoformat(date_from)
+                date_to = date_to and datetime.fromisoformat(date_to)
+                if any((not date_from or departure_time >= date_from) and (not date_to or departure_time < date_to)
+                       for departure_time in departures):
+                    stale.append(key)
+            for key in stale:
+                self.store.delete(key)
+            self.index.discard(group, stale)
+            dropped += len(stale)
+        with self._lock:
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        self.store.clear()
+        self.index.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': getattr(self.store, 'evictions', None),
+            'expirations': getattr(self.store, 'expirations', None),
+            'invalidations': self.invalidations,
+            'size': len(self.store.keys()),
+        }
@@ -0,0 +1,164 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Upper bounds, in seconds, of the pool checkout wait histogram buckets
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+# Sync driver -> asyncio driver for the same database
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+def async_database_url(url):
+    """
+    Rewrite a sync SQLAlchemy URL (as used by Flask) to its asyncio driver.
+    """
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+class PoolStats:
+    """
+    Checkout waits, timeouts and current use of one named pool.
+    """
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.pool = None
+        self.waits = [0] * (len(WAIT_BUCKETS) + 1)
+        self.wait_seconds = 0.0
+        self.timeouts = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, timed_out=False):
+        bucket = bisect.bisect_left(WAIT_BUCKETS, seconds)
+        with self._lock:
+            self.waits[bucket] += 1
+            self.wait_seconds += seconds
+            self.timeouts += timed_out
+
+    def in_use(self):
+        return self.pool.checkedout() if self.pool is not None else 0
+
+# PoolStats of every engine built by engine_options, by name
+pools = {}
+
+class _TimedPool:
+    """
+    Mixin timing how long each checkout waited for a connection.
+    """
+    stats = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Also reached by Pool.recreate(), which keeps the class
+        self.stats.pool = self
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeout:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+def _timed_pool(base, stats):
+    return type(f'Timed{base.__name__}', (_TimedPool, base), {'stats': stats})
+
+def _statement_timeout_args(url, milliseconds):
+    """
+    connect_args applying a per-session statement timeout, for the
+    drivers that support one.
+    """
+    backend, driver = url.get_backend_name(), url.get_driver_name()
+    if backend == 'mysql':
+        # MySQL only enforces max_execution_time on SELECT statements
+        return {'init_command': f'SET SESSION max_execution_time = {milliseconds}'}
+    if backend == 'postgresql' and driver == 'asyncpg':
+        return {'server_settings': {'statement_timeout': str(milliseconds)}}
+    if backend == 'postgresql':
+        return {'options': f'-c statement_timeout={milliseconds}'}
+    return {}
+
+def engine_options(config, name, asynchronous=False):
+    """
+    create_engine() keyword arguments from the DB_* settings, shared by
+    Flask-SQLAlchemy (SQLALCHEMY_ENGINE_OPTIONS) and the FastAPI engine.
+    The pool is registered under name in `pools`. SQLite keeps
+    SQLAlchemy's default pool: it has no server to size a pool against.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    size, overflow = config['DB_POOL_SIZE'], config['DB_MAX_OVERFLOW']
+    stats = pools[name] = PoolStats(name, size + overflow)
+    options = {
+        'poolclass': _timed_pool(AsyncAdaptedQueuePool if asynchronous else QueuePool, stats),
+        'pool_size': size,
+        'max_overflow': overflow,
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = _statement_timeout_args(url, config['DB_STATEMENT_TIMEOUT_MS'])
+    return options
+
+def make_engine(config, name, asynchronous=False):
+    """
+    The engine for config['SQLALCHEMY_DATABASE_URI'], tuned from config;
+    an AsyncEngine on the matching asyncio driver if asynchronous.
+    """
+    options = engine_options(config, name, asynchronous)
+    if asynchronous:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        return create_async_engine(async_database_url(config['SQLALCHEMY_DATABASE_URI']), **options)
+    return create_engine(config['SQLALCHEMY_DATABASE_URI'], **options)
+
+def render_pool_metrics():
+    """
+    Prometheus text lines for every registered pool; a Metrics collector.
+    """
+    lines = [
+        '# HELP db_pool_checkout_wait_seconds Time spent waiting for a pooled connection.',
+        '# TYPE db_pool_checkout_wait_seconds histogram',
+    ]
+    gauges = []
+    for name, stats in sorted(pools.items()):
+        with stats._lock:
+            waits, wait_seconds, timeouts = list(stats.waits), stats.wait_seconds, stats.timeouts
+        cumulative = 0
+        for bound, count in zip(WAIT_BUCKETS + (float('inf'),), waits):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'db_pool_checkout_wait_seconds_bucket{{pool="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'db_pool_checkout_wait_seconds_sum{{pool="{name}"}} {wait_seconds:.6f}')
+        lines.append(f'db_pool_checkout_wait_seconds_count{{pool="{name}"}} {cumulative}')
+        in_use = stats.in_use()
+        gauges.append((name, timeouts, in_use, stats.capacity, in_use / stats.capacity if stats.capacity else 0))
+
+    lines += ['# HELP db_pool_checkout_timeouts_total Checkouts that gave up after DB_POOL_TIMEOUT.',
+              '# TYPE db_pool_checkout_timeouts_total counter']
+    lines += [f'db_pool_checkout_timeouts_total{{pool="{name}"}} {timeouts}' for name, timeouts, _, _, _ in gauges]
+    lines += ['# HELP db_pool_connections_in_use Connections checked out of the pool.',
+              '# TYPE db_pool_connections_in_use gauge']
+    lines += [f'db_pool_connections_in_use{{pool="{name}"}} {in_use}' for name, _, in_use, _, _ in gauges]
+    lines += ['# HELP db_pool_capacity DB_POOL_SIZE + DB_MAX_OVERFLOW.', '# TYPE db_pool_capacity gauge']
+    lines += [f'db_pool_capacity{{pool="{name}"}} {capacity}' for name, _, _, capacity, _ in gauges]
+    lines += ['# HELP db_pool_saturation Share of the pool capacity in use.', '# TYPE db_pool_saturation gauge']
+    lines += [f'db_pool_saturation{{pool="{name}"}} {saturation:.3f}' for name, _, _, _, saturation in gauges]
+    return lines
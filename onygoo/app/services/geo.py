@@ -0,0 +1,200 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+EPOCH = datetime(1970, 1, 1)
+
+def _seconds(value):
+    return (value - EPOCH).total_seconds()
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distances from one point to arrays of points, in km.
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+class GeoIndex:
+    """
+    In-memory grid index of active rides with coordinates. Rides are bucketed
+    by the grid cell of their origin; a radius search only gathers the cells
+    the origin circle overlaps, then filters the candidates' origin and
+    destination distances and departure times with NumPy in one pass.
+    Coordinates live in contiguous arrays, with freed slots reused.
+
+    Each process keeps its own copy: it is updated in place when this process
+    proposes, modifies or cancels a ride, and rebuilt from the database when
+    older than GEO_INDEX_TTL seconds to pick up other processes' changes.
+    Callers re-check the returned ids against the database.
+    """
+
+    def __init__(self, cell_degrees=0.1, ttl=300, capacity=1024):
+        self.cell_degrees = cell_degrees
+        self.ttl = ttl
+        self.loaded_at = None
+        self._lock = threading.Lock()
+        self._allocate(capacity)
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        self.cell_degrees = config.get('GEO_CELL_DEGREES', self.cell_degrees)
+        self.ttl = config.get('GEO_INDEX_TTL', self.ttl)
+
+    def _allocate(self, capacity):
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        # origin lat, origin lon, destination lat, destination lon
+        self._coords = np.zeros((capacity, 4))
+        self._departures = np.zeros(capacity)
+        self._slots = {}
+        self._cells = defaultdict(set)
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        capacity = len(self._ids)
+        self._ids = np.concatenate([self._ids, np.zeros(capacity, dtype=np.int64)])
+        self._coords = np.concatenate([self._coords, np.zeros((capacity, 4))])
+        self._departures = np.concatenate([self._departures, np.zeros(capacity)])
+        self._free.extend(range(2 * capacity - 1, capacity - 1, -1))
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    @staticmethod
+    def entry_of(ride):
+        """
+        What the index keeps of a ride, or None if it should not be indexed.
+        Capture it before commit, like SearchCache.scope_of.
+        """
+        coords = (ride.origin_lat, ride.origin_lon, ride.destination_lat, ride.destination_lon)
+        if ride.status != 'active' or any(value is None for value in coords):
+            return None
+        return coords + (ride.departure_time,)
+
+    def put(self, ride_id, entry):
+        """
+        Insert, move or (with entry None) drop a ride.
+        """
+        with self._lock:
+            self._remove(ride_id)
+            if entry is not None:
+                self._insert(ride_id, entry)
+
+    def remove(self, ride_id):
+        with self._lock:
+            self._remove(ride_id)
+
+    def invalidate(self):
+        """
+        Force a rebuild before the next search, e.g. after a bulk import.
+        """
+        self.loaded_at = None
+
+    def _insert(self, ride_id, entry):
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        origin_lat, origin_lon, destination_lat, destination_lon, departure_time = entry
+        self._ids[slot] = ride_id
+        self._coords[slot] = (origin_lat, origin_lon, destination_lat, destination_lon)
+        self._departures[slot] = _seconds(departure_time)
+        self._slots[ride_id] = slot
+        self._cells[self._cell(origin_lat, origin_lon)].add(slot)
+
+    def _remove(self, ride_id):
+        slot = self._slots.pop(ride_id, None)
+        if slot is None:
+            return
+        cell = self._cell(self._coords[slot, 0], self._coords[slot, 1])
+        self._cells[cell].discard(slot)
+        if not self._cells[cell]:
+            del self._cells[cell]
+        self._free.append(slot)
+
+    @staticmethod
+    def rows_statement():
+        # Imported here: the models import app.extensions, which creates the index
+        from app.models.models import Ride
+
+        return select(
+            Ride.id, Ride.origin_lat, Ride.origin_lon, Ride.destination_lat, Ride.destination_lon, Ride.departure_time
+        ).where(Ride.status == 'active', Ride.origin_lat.isnot(None), Ride.destination_lat.isnot(None))
+
+    def rebuild(self, rows):
+        """
+        Replace the index with rows of (id, origin_lat, origin_lon,
+        destination_lat, destination_lon, departure_time).
+        """
+        rows = [tuple(row) for row in rows if None not in tuple(row)]
+        with self._lock:
+            self._allocate(max(1024, 2 * len(rows)))
+            for row in rows:
+                self._insert(row[0], row[1:])
+            self.loaded_at = time.monotonic()
+
+    def stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    def ensure_loaded(self, session):
+        if self.stale():
+            self.rebuild(session.execute(self.rows_statement()))
+
+    async def ensure_loaded_async(self, session):
+        if self.stale():
+            self.rebuild(await session.execute(self.rows_statement()))
+
+    def _cells_around(self, lat, lon, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = min(180.0, radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)))
+        lat_low, lon_low = self._cell(lat - lat_span, lon - lon_span)
+        lat_high, lon_high = self._cell(lat + lat_span, lon + lon_span)
+        for lat_cell in range(lat_low, lat_high + 1):
+            for lon_cell in range(lon_low, lon_high + 1):
+                yield lat_cell, lon_cell
+
+    def search(self, origin, destination, radius_km, start=None, end=None):
+        """
+        Rides whose origin is within radius_km of origin (lat, lon) and whose
+        destination is within radius_km of destination, departing in
+        [start, end). Returns (ride_id, origin_km, destination_km) tuples
+        ordered by departure time, then origin distance.
+        """
+        with self._lock:
+            slots = set()
+            for cell in self._cells_around(origin[0], origin[1], radius_km):
+                slots.update(self._cells.get(cell, ()))
+            if not slots:
+                return []
+            index = np.fromiter(slots, dtype=np.int64, count=len(slots))
+            ids = self._ids[index]
+            coords = self._coords[index]
+            departures = self._departures[index]
+
+        keep = np.ones(len(index), dtype=bool)
+        if start is not None:
+            keep &= departures >= _seconds(start)
+        if end is not None:
+            keep &= departures < _seconds(end)
+        origin_km = haversine_km(origin[0], origin[1], coords[:, 0], coords[:, 1])
+        destination_km = haversine_km(destination[0], destination[1], coords[:, 2], coords[:, 3])
+        keep &= (origin_km <= radius_km) & (destination_km <= radius_km)
+
+        ids, origin_km, destination_km, departures = ids[keep], origin_km[keep], destination_km[keep], departures[keep]
+        order = np.lexsort((origin_km, departures))
+        return [
+            (int(ids[i]), round(float(origin_km[i]), 3), round(float(destination_km[i]), 3))
+            for i in order
+        ]
+
+    def __len__(self):
+        return len(self._slots)
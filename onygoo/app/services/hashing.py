@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from passlib.context import CryptContext
+from werkzeug.security import check_password_hash
+
+class HashingQueueFull(Exception):
+    pass
+
+# One CryptContext per cost factor, built lazily inside each worker process
+_contexts = {}
+
+def _context(rounds):
+    context = _contexts.get(rounds)
+    if context is None:
+        # min == max == default so hashes made with any other cost are flagged for rehash
+        context = CryptContext(
+            schemes=['bcrypt'],
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds
+        )
+        _contexts[rounds] = context
+    return context
+
+def _hash(password, rounds):
+    return _context(rounds).hash(password)
+
+def _verify(password, password_hash, rounds):
+    """
+    Returns (matches, new_hash); new_hash is set when the stored hash should be
+    replaced because it uses another cost factor or a legacy werkzeug format.
+    """
+    if not password_hash.startswith('$'):
+        # Hashes written by werkzeug's generate_password_hash before bcrypt was shared
+        if not check_password_hash(password_hash, password):
+            return False, None
+        return True, _hash(password, rounds)
+    return _context(rounds).verify_and_update(password, password_hash)
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a bounded process pool so it
+    never blocks a request worker or the event loop. At most `max_pending`
+    jobs may be queued; beyond that HashingQueueFull is raised so callers
+    can shed load instead of piling up.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_pending=64):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        self.rounds = config.get('PASSWORD_HASH_ROUNDS', self.rounds)
+        self.workers = config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self.shutdown()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingQueueFull()
+        slots = self._slots
+        try:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                future = self._executor.submit(fn, *args, self.rounds)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def hash(self, password):
+        return self._submit(_hash, password).result()
+
+    def verify(self, password, password_hash):
+        return self._submit(_verify, password, password_hash).result()
+
+    async def hash_async(self, password):
+        return await asyncio.wrap_future(self._submit(_hash, password))
+
+    async def verify_async(self, password, password_hash):
+        return await asyncio.wrap_future(self._submit(_verify, password, password_hash))
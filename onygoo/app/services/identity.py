@@ -0,0 +1,60 @@
+import time
+from collections import namedtuple
+from app.services.cache import RedisStore, TTLCache
+
+# Immutable snapshot of the columns authenticated endpoints need, safe to
+# share between requests (unlike an ORM instance bound to one session)
+CurrentUser = namedtuple('CurrentUser', 'id email role is_active is_email_verified')
+
+def snapshot_user(user):
+    return CurrentUser(user.id, user.email, user.role, user.is_active, user.is_email_verified)
+
+class IdentityCache:
+    """
+    Short-lived cache of decoded access tokens and the users they belong to.
+    Claims are keyed by token and never outlive their exp; users are keyed by
+    id so invalidate_user() can drop one when an admin changes it.
+
+    invalidate_user() only reaches other processes (Flask workers, the
+    FastAPI app) through a shared store: set CACHE_REDIS_URL when running
+    more than one. Otherwise a deactivated user keeps access for at most
+    IDENTITY_CACHE_TTL seconds, which is why it defaults to a few seconds.
+    """
+
+    def __init__(self, maxsize=10000, ttl=5, claims_ttl=300):
+        self.claims = TTLCache(maxsize, claims_ttl)
+        self.users = TTLCache(maxsize, ttl)
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        maxsize = config.get('IDENTITY_CACHE_SIZE', 10000)
+        ttl = config.get('IDENTITY_CACHE_TTL', 5)
+        # Claims are immutable for a token: a longer, per-process cache is enough
+        self.claims = TTLCache(maxsize, config.get('IDENTITY_CLAIMS_TTL', 300))
+        if config.get('IDENTITY_CACHE_STORE') is not None:
+            self.users = config['IDENTITY_CACHE_STORE']
+        elif config.get('CACHE_REDIS_URL'):
+            self.users = RedisStore(config['CACHE_REDIS_URL'], 'identity', ttl)
+        else:
+            self.users = TTLCache(maxsize, ttl)
+
+    def get_claims(self, token):
+        claims = self.claims.get(token)
+        if claims is not None and claims.get('exp', 0) <= time.time():
+            self.claims.delete(token)
+            return None
+        return claims
+
+    def set_claims(self, token, claims):
+        self.claims.set(token, claims)
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def set_user(self, user):
+        self.users.set(user.id, user)
+
+    def invalidate_user(self, user_id):
+        self.users.delete(user_id)
@@ -0,0 +1,131 @@
+import re
+import unicodedata
+
+from sqlalchemy import and_, false, or_, select, union
+
+# Normalized keys only contain [a-z0-9 ], so '~' sorts after every key that
+# starts with a given prefix and can be used as an exclusive upper bound.
+_KEY_UPPER_BOUND = '~'
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+def normalize_location(value):
+    """
+    Build the search key for a free-text location.
+    Folds case and accents and reduces the text to space-separated tokens,
+    e.g. 'Saint-Étienne (Gare)' -> 'saint etienne gare'.
+    """
+    if not value:
+        return ''
+    folded = unicodedata.normalize('NFKD', value)
+    folded = ''.join(c for c in folded if not unicodedata.combining(c)).lower()
+    return ' '.join(_NON_ALNUM.sub(' ', folded).split())
+
+def location_tokens(key):
+    """
+    The suffixes of a normalized key that start at a token, the key itself
+    first: 'saint etienne gare' -> 'saint etienne gare', 'etienne gare', 'gare'.
+    """
+    tokens = key.split(' ') if key else []
+    return [' '.join(tokens[start:]) for start in range(len(tokens))]
+
+def location_keys_statement(*keys):
+    """
+    (token, key) of location_tokens whose token starts with any of the
+    normalized keys, as index ranges.
+    """
+    # Imported here: the models import this module
+    from app.models.models import LocationToken
+
+    return select(LocationToken.token, LocationToken.key).where(or_(*(
+        and_(LocationToken.token >= key, LocationToken.token < key + _KEY_UPPER_BOUND) for key in keys
+    )))
+
+def _keys_found(keys, rows):
+    return [
+        None if key is None else sorted({stored for token, stored in rows if key and token.startswith(key)})
+        for key in keys
+    ]
+
+def location_keys(session, *values):
+    """
+    Token prefix match of free-text locations: for each value, the stored
+    keys it finds ('etienne' and 'saint eti' both find 'saint etienne
+    gare'), resolved in one query on location_tokens, which only holds the
+    distinct keys. None for a missing value and [] for one without any
+    letter or digit. Pass the lists to location_key_filter.
+    """
+    keys = [normalize_location(value) if value else None for value in values]
+    searched = [key for key in keys if key]
+    rows = session.execute(location_keys_statement(*searched)).all() if searched else []
+    return _keys_found(keys, rows)
+
+async def location_keys_async(session, *values):
+    """
+    location_keys for an AsyncSession.
+    """
+    keys = [normalize_location(value) if value else None for value in values]
+    searched = [key for key in keys if key]
+    rows = (await session.execute(location_keys_statement(*searched))).all() if searched else []
+    return _keys_found(keys, rows)
+
+def location_key_filter(column, keys):
+    """
+    Filter a location key column on keys from location_keys. A literal IN
+    list lets the planner seek the search indexes on each key (a subquery
+    there makes SQLite prefer the (status, departure_time) index and scan).
+    """
+    return column.in_(keys) if keys else false()
+
+def location_token_rows(keys):
+    return [{'token': token, 'key': key} for key in set(keys) for token in location_tokens(key)]
+
+def location_tokens_insert(dialect):
+    """
+    INSERT into location_tokens that skips rows already there.
+    """
+    from app.models.models import LocationToken
+
+    if dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(LocationToken.__table__).on_conflict_do_nothing()
+    return LocationToken.__table__.insert().prefix_with('OR IGNORE', dialect='sqlite').prefix_with('IGNORE', dialect='mysql')
+
+def register_location_keys(connection, keys):
+    """
+    Make the keys of rides or templates written on connection searchable.
+    Every writer of origin_key/destination_key goes through this (the ORM
+    through mapper events); keys no longer used are harmless leftovers.
+    """
+    rows = location_token_rows(keys)
+    if rows:
+        connection.execute(location_tokens_insert(connection.dialect), rows)
+
+async def register_location_keys_async(connection, keys):
+    """
+    register_location_keys for an AsyncConnection.
+    """
+    rows = location_token_rows(keys)
+    if rows:
+        await connection.execute(location_tokens_insert(connection.dialect), rows)
+
+def index_location_keys(connection, batch_size=1000):
+    """
+    Register every key of the rides and ride_templates tables, for rows
+    loaded without going through register_location_keys. Idempotent.
+    Returns the number of distinct keys.
+    """
+    from app.models.models import Ride, RideTemplate
+
+    keys = connection.execute(union(
+        select(Ride.origin_key), select(Ride.destination_key),
+        select(RideTemplate.origin_key), select(RideTemplate.destination_key),
+    )).scalars().all()
+    for start in range(0, len(keys), batch_size):
+        register_location_keys(connection, keys[start:start + batch_size])
+    return len(keys)
+
+def location_key_matches(stored_key, key):
+    """
+    location_key_filter in Python, for keys already normalized.
+    """
+    return bool(key) and (stored_key.startswith(key) or ' ' + key in stored_key)
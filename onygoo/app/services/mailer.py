@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+
+class MailQueueFull(Exception):
+    pass
+
+class MailDispatcher:
+    """
+    Delivers Flask-Mail messages from a bounded queue with a fixed pool of
+    worker threads. Each worker keeps one SMTP connection open while there is
+    mail to send and closes it after MAIL_IDLE_TIMEOUT seconds without work.
+    A failed send is retried on a fresh connection with exponential backoff.
+    """
+
+    def __init__(self, mail=None, workers=2, queue_size=1000):
+        self.mail = mail
+        self.app = None
+        self.workers = workers
+        self.enqueue_timeout = 0.5
+        self.idle_timeout = 30
+        self.max_retries = 3
+        self.retry_backoff = 1.0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def init_app(self, app, mail=None):
+        self.app = app
+        self.mail = mail or self.mail
+        self.workers = app.config.get('MAIL_WORKERS', self.workers)
+        self.enqueue_timeout = app.config.get('MAIL_ENQUEUE_TIMEOUT', self.enqueue_timeout)
+        self.idle_timeout = app.config.get('MAIL_IDLE_TIMEOUT', self.idle_timeout)
+        self.max_retries = app.config.get('MAIL_MAX_RETRIES', self.max_retries)
+        self.retry_backoff = app.config.get('MAIL_RETRY_BACKOFF', self.retry_backoff)
+        self._queue = queue.Queue(maxsize=app.config.get('MAIL_QUEUE_SIZE', 1000))
+
+    def send(self, msg):
+        """
+        Queue a message for delivery. Blocks for at most MAIL_ENQUEUE_TIMEOUT
+        seconds when the queue is full, then raises MailQueueFull.
+        """
+        self._ensure_workers()
+        try:
+            self._queue.put(msg, timeout=self.enqueue_timeout)
+        except queue.Full:
+            raise MailQueueFull()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def join(self):
+        """
+        Wait until every queued message has been handled.
+        """
+        self._queue.join()
+
+    def _ensure_workers(self):
+        # Started on first use so importing the app (or the reloader parent) spawns nothing
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name='mail-worker', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self):
+        with self.app.app_context():
+            connection = None
+            while True:
+                try:
+                    msg = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    connection = self._close(connection)
+                    continue
+                try:
+                    connection = self._deliver(connection, msg)
+                finally:
+                    self._queue.task_done()
+
+    def _deliver(self, connection, msg):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if connection is None:
+                    connection = self.mail.connect()
+                    connection.__enter__()
+                connection.send(msg)
+                return connection
+            except Exception as exc:
+                connection = self._close(connection)
+                if attempt == self.max_retries:
+                    self.app.logger.error('Dropping email to %s after %d attempts: %s', msg.recipients, attempt + 1, exc)
+                    return None
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def _close(self, connection):
+        if connection is not None:
+            try:
+                connection.__exit__(None, None, None)
+            except Exception:
+                pass
+        return None
@@ -0,0 +1,205 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# [query count, query seconds] of the request being handled in this context
+_request_queries = ContextVar('request_queries', default=None)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+class Metrics:
+    """
+    Process-local request metrics in the Prometheus text format: a latency
+    histogram and status counters per (method, route), an in-flight gauge,
+    and SQL query count and time per route, measured with engine cursor
+    events and attributed to the request running in the current context.
+    Each request costs two perf_counter() calls and one locked update;
+    each query two perf_counter() calls and no lock.
+    Routes are labelled with their URL rule, never the raw path.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._sums = defaultdict(float)
+        self._statuses = defaultdict(int)
+        self._queries = defaultdict(int)
+        self._query_seconds = defaultdict(float)
+        self._collectors = []
+        self._engine_hooked = False
+
+    def init_app(self, app):
+        """
+        Instrument a Flask app and serve /metrics from it.
+        """
+        from flask import Response, g, request
+
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self.instrument_engines()
+
+        @app.before_request
+        def _start_timer():
+            g._metrics = self.begin()
+
+        @app.after_request
+        def _record_status(response):
+            g._metrics_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def _stop_timer(exc):
+            state = g.pop('_metrics', None)
+            if state is None:
+                return
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            self.end(state, request.method, route, g.pop('_metrics_status', 500))
+
+        app.add_url_rule('/metrics', 'metrics', lambda: Response(self.render(), content_type=CONTENT_TYPE))
+
+    def add_collector(self, collector):
+        """
+        Append the lines returned by collector() to every render, once.
+        """
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def instrument_engines(self):
+        """
+        Listen to the cursor events of every engine, including the sync
+        engines behind AsyncEngines. Safe to call more than once.
+        """
+        if self._engine_hooked:
+            return
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        self._engine_hooked = True
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the execution context, which is discarded with the
+        # statement, so statements that raise leave nothing behind
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        counters = _request_queries.get()
+        if counters is not None:
+            counters[0] += 1
+            counters[1] += elapsed
+        else:
+            # Scheduler jobs, CLI commands and streamed bodies after the request ended
+            with self._lock:
+                self._queries['none'] += 1
+                self._query_seconds['none'] += elapsed
+
+    def begin(self):
+        counters = [0, 0.0]
+        with self._lock:
+            self.in_flight += 1
+        return time.perf_counter(), counters, _request_queries.set(counters)
+
+    def end(self, state, method, route, status):
+        started, counters, token = state
+        elapsed = time.perf_counter() - started
+        _request_queries.reset(token)
+        bucket = bisect.bisect_left(self.buckets, elapsed)
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            self._histograms[key][bucket] += 1
+            self._sums[key] += elapsed
+            self._statuses[(method, route, status)] += 1
+            self._queries[route] += counters[0]
+            self._query_seconds[route] += counters[1]
+
+    def render(self):
+        """
+        All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            histograms = {key: list(counts) for key, counts in self._histograms.items()}
+            sums = dict(self._sums)
+            statuses = dict(self._statuses)
+            queries = dict(self._queries)
+            query_seconds = dict(self._query_seconds)
+            in_flight = self.in_flight
+
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (method, route), counts in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'http_request_duration_seconds_bucket{_labels(method=method, route=route, le=le)} {cumulative}')
+            labels = _labels(method=method, route=route)
+            lines.append(f'http_request_duration_seconds_sum{labels} {sums[(method, route)]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{labels} {cumulative}')
+
+        lines += ['# HELP http_requests_total Responses by route and status.', '# TYPE http_requests_total counter']
+        for (method, route, status), count in sorted(statuses.items()):
+            lines.append(f'http_requests_total{_labels(method=method, route=route, status=status)} {count}')
+
+        lines += ['# HELP http_requests_in_flight Requests being handled.', '# TYPE http_requests_in_flight gauge']
+        lines.append(f'http_requests_in_flight {in_flight}')
+
+        lines += ['# HELP db_queries_total SQL statements executed, by route.', '# TYPE db_queries_total counter']
+        for route, count in sorted(queries.items()):
+            lines.append(f'db_queries_total{_labels(route=route)} {count}')
+        lines += ['# HELP db_query_seconds_total Time spent in SQL statements, by route.',
+                  '# TYPE db_query_seconds_total counter']
+        for route, seconds in sorted(query_seconds.items()):
+            lines.append(f'db_query_seconds_total{_labels(route=route)} {seconds:.6f}')
+        for collector in self._collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording FastAPI requests into a Metrics registry:
+        app.add_middleware(MetricsMiddleware, metrics=metrics)
+    """
+
+    def __init__(self, app, metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        state = self.metrics.begin()
+        status = [500]
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            self.metrics.end(state, scope['method'], route, status[0])
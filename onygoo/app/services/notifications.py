@@ -0,0 +1,72 @@
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from app.models.models import Notification, User
+
+# Every change to notifications.is_read goes through these statements together
+# with the matching counter update, in the same transaction, so
+# users.unread_notifications always equals the number of unread rows.
+
+# Fields of NotificationResponse, selected as columns by the inbox fast path
+NOTIFICATION_FIELDS = ('id', 'title', 'message', 'user_id', 'is_read', 'created_at')
+NOTIFICATION_COLUMNS = tuple(getattr(Notification, field) for field in NOTIFICATION_FIELDS)
+
+class UserNotFound(Exception):
+    pass
+
+def adjust_unread_statement(user_id, delta):
+    return (
+        update(User)
+        .where(User.id == user_id)
+        .values(unread_notifications=User.unread_notifications + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+def mark_read_statement(user_id, notification_id=None):
+    """
+    Mark one (or, without notification_id, every) unread notification of a
+    user as read. rowcount is the number of rows that actually flipped.
+    """
+    statement = update(Notification).where(Notification.user_id == user_id, Notification.is_read.is_(False))
+    if notification_id is not None:
+        statement = statement.where(Notification.id == notification_id)
+    return (
+        statement
+        .values(is_read=True, read_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+def notify(session, user_id, title, message):
+    """
+    Add an unread notification for a user; the caller commits.
+    The counter is bumped first, so a missing user is found by its rowcount
+    before the insert; a user deleted in between fails the foreign key at
+    flush. Both roll back and raise UserNotFound.
+    """
+    if session.execute(adjust_unread_statement(user_id, 1)).rowcount != 1:
+        session.rollback()
+        raise UserNotFound()
+    notification = Notification(user_id=user_id, title=title, message=message)
+    session.add(notification)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        raise UserNotFound()
+    return notification
+
+async def notify_async(session, user_id, title, message):
+    """
+    notify for an AsyncSession.
+    """
+    if (await session.execute(adjust_unread_statement(user_id, 1))).rowcount != 1:
+        await session.rollback()
+        raise UserNotFound()
+    notification = Notification(user_id=user_id, title=title, message=message)
+    session.add(notification)
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        raise UserNotFound()
+    return notification
@@ -0,0 +1,117 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from app.services.serialization import dumps
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+STREAM_CHUNK_SIZE = 500
+
+def clamp_limit(limit):
+    """
+    Coerce a user supplied page size into [1, MAX_PAGE_SIZE].
+    """
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def encode_cursor(sort_value, row_id):
+    """
+    Encode the (sort value, id) of the last row of a page as an opaque cursor.
+    The sort value may be a datetime, a number or a string.
+    """
+    if isinstance(sort_value, datetime):
+        sort_value = {'dt': sort_value.isoformat()}
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+    Raises ValueError if the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if isinstance(sort_value, dict):
+            sort_value = datetime.fromisoformat(sort_value['dt'])
+        return sort_value, int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def apply_keyset(query, sort_column, id_column, cursor=None, limit=None, descending=False):
+    """
+    Order query by (sort_column, id_column) and resume after cursor.
+    When limit is given, one extra row is fetched so paginate() can tell
+    whether another page exists.
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(
+                sort_column <= sort_value,
+                or_(sort_column < sort_value, and_(sort_column == sort_value, id_column < row_id))
+            )
+        else:
+            query = query.filter(
+                sort_column >= sort_value,
+                or_(sort_column > sort_value, and_(sort_column == sort_value, id_column > row_id))
+            )
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+def paginate(rows, limit, sort_attr, id_attr='id'):
+    """
+    Split the limit + 1 rows fetched by apply_keyset into a page and next_cursor.
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_attr), getattr(last, id_attr))
+
+def iter_json_array(rows, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield a JSON array of serialized rows, as bytes, in chunks of
+    chunk_size items, so the full result never has to be held in memory.
+    """
+    yield b'['
+    chunk = []
+    first = True
+    for row in rows:
+        chunk.append(dumps(serialize(row)))
+        if len(chunk) >= chunk_size:
+            yield (b'' if first else b',') + b','.join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield (b'' if first else b',') + b','.join(chunk)
+    yield b']'
+
+async def aiter_json_array(rows, serialize, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    iter_json_array for an async iterable of rows.
+    """
+    yield b'['
+    chunk = []
+    first = True
+    async for row in rows:
+        chunk.append(dumps(serialize(row)))
+        if len(chunk) >= chunk_size:
+            yield (b'' if first else b',') + b','.join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield (b'' if first else b',') + b','.join(chunk)
+    yield b']'
@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 64 * 1024
+# Room for the multipart boundaries, headers and other form fields of an upload
+MULTIPART_OVERHEAD = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of the image formats we accept -> stored extension
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'RIFF', 'webp'),
+)
+
+class PhotoError(Exception):
+    pass
+
+class PhotoTooLarge(PhotoError):
+    pass
+
+class UnsupportedPhoto(PhotoError):
+    pass
+
+def _sniff(head):
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            if extension == 'webp' and head[8:12] != b'WEBP':
+                continue
+            return extension
+    return None
+
+def _make_thumbnails(source, folder, digest, sizes):
+    # Pillow is optional: without it clients simply get the original
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for size in sizes:
+            target = os.path.join(folder, digest[:2], f'{digest}_{size}.jpg')
+            if os.path.exists(target):
+                continue
+            variant = ImageOps.fit(image, (size, size))
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as tmp:
+                variant.save(tmp, 'JPEG', quality=85, optimize=True)
+            os.replace(tmp_path, target)
+
+def _log_failure(key, future):
+    # Clients keep getting the original, so a failure is only visible here
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Thumbnails of photo %s failed', key, exc_info=future.exception())
+
+class PhotoStore:
+    """
+    Content-addressed storage for profile photos. Uploads are streamed to
+    disk in chunks while being hashed, so a file is never held in memory and
+    identical images are stored once as <sha256>.<ext>. Square JPEG
+    thumbnails, center-cropped, for each of PHOTO_THUMBNAIL_SIZES are
+    generated off the request path on a small thread pool (Pillow needed;
+    failures are logged and clients keep getting the original).
+    """
+
+    def __init__(self, folder='uploads/profile_photos', url_prefix='/static/uploads/profile_photos',
+                 max_bytes=5 * 1024 * 1024, sizes=(64, 256, 512), workers=2):
+        self.folder = folder
+        self.url_prefix = url_prefix
+        self.max_bytes = max_bytes
+        self.sizes = tuple(sizes)
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configure(app.config)
+
+    def configure(self, config):
+        self.folder = config.get('PHOTO_UPLOAD_FOLDER', self.folder)
+        self.url_prefix = config.get('PHOTO_URL_PREFIX', self.url_prefix).rstrip('/')
+        self.max_bytes = config.get('PHOTO_MAX_BYTES', self.max_bytes)
+        self.sizes = tuple(config.get('PHOTO_THUMBNAIL_SIZES', self.sizes))
+        self.workers = config.get('PHOTO_WORKERS', self.workers)
+
+    def save(self, stream):
+        """
+        Store an uploaded image and return its key '<sha256>.<ext>'.
+        Raises PhotoTooLarge or UnsupportedPhoto; nothing is kept in that case.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        extension = None
+        fd, tmp_path = tempfile.mkstemp(dir=self.folder, suffix='.upload')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if extension is None:
+                        extension = _sniff(chunk)
+                        if extension is None:
+                            raise UnsupportedPhoto()
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise PhotoTooLarge()
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            if extension is None:
+                raise UnsupportedPhoto()
+            key = f'{digest.hexdigest()}.{extension}'
+            target = self.path(key)
+            if os.path.exists(target):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.schedule_thumbnails(key)
+        return key
+
+    @property
+    def max_request_bytes(self):
+        """
+        Limit for a whole upload request, so oversized bodies are refused
+        while being received instead of after being spooled to disk.
+        """
+        return self.max_bytes + MULTIPART_OVERHEAD
+
+    def schedule_thumbnails(self, key):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='photo')
+        digest = key.split('.')[0]
+        future = self._executor.submit(_make_thumbnails, self.path(key), self.folder, digest, self.sizes)
+        future.add_done_callback(lambda done: _log_failure(key, done))
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def path(self, key, size=None):
+        digest, extension = key.split('.')
+        name = f'{digest}_{size}.jpg' if size else f'{digest}.{extension}'
+        return os.path.join(self.folder, digest[:2], name)
+
+    def url(self, key, size=None):
+        """
+        URL of the smallest variant at least `size` pixels wide, falling back
+        to the original while thumbnails are still being generated.
+        """
+        digest, extension = key.split('.')
+        if size:
+            for variant in sorted(self.sizes):
+                if variant >= size and os.path.exists(self.path(key, variant)):
+                    return f'{self.url_prefix}/{digest[:2]}/{digest}_{variant}.jpg'
+        return f'{self.url_prefix}/{digest[:2]}/{digest}.{extension}'
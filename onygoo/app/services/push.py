@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.cache import TTLCache
+
+# Per-token outcomes a provider can report
+INVALID_TOKEN = 'invalid_token'
+UNAVAILABLE = 'unavailable'
+
+BatchResult = namedtuple('BatchResult', 'index size sent failed invalid_tokens error')
+
+class PushProvider:
+    """
+    Interface for push backends. send_batch() delivers one message to at most
+    max_batch_size tokens and returns a list with one entry per token: None on
+    success, INVALID_TOKEN for unregistered tokens or UNAVAILABLE otherwise.
+    """
+    max_batch_size = 500
+
+    def send_batch(self, tokens, title, message, data=None):
+        raise NotImplementedError
+
+class InMemoryPushProvider(PushProvider):
+    """
+    Fake provider that records deliveries, for tests and offline benchmarks.
+    `latency` simulates the round trip of one batch request.
+    """
+
+    def __init__(self, invalid_tokens=(), latency=0.0, max_batch_size=500):
+        self.invalid_tokens = set(invalid_tokens)
+        self.latency = latency
+        self.max_batch_size = max_batch_size
+        self.delivered = []
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def send_batch(self, tokens, title, message, data=None):
+        if self.latency:
+            time.sleep(self.latency)
+        results = [INVALID_TOKEN if token in self.invalid_tokens else None for token in tokens]
+        with self._lock:
+            self.requests += 1
+            self.delivered.extend(token for token, result in zip(tokens, results) if result is None)
+        return results
+
+class FirebasePushProvider(PushProvider):
+    """
+    Firebase Cloud Messaging multicast; requires firebase_admin to be
+    installed and initialized.
+    """
+
+    def send_batch(self, tokens, title, message, data=None):
+        from firebase_admin import messaging
+
+        response = messaging.send_each_for_multicast(messaging.MulticastMessage(
+            tokens=list(tokens),
+            notification=messaging.Notification(title=title, body=message),
+            data=data
+        ))
+        results = []
+        for item in response.responses:
+            if item.success:
+                results.append(None)
+            elif isinstance(item.exception, messaging.UnregisteredError):
+                results.append(INVALID_TOKEN)
+            else:
+                results.append(UNAVAILABLE)
+        return results
+
+class PushFanout:
+    """
+    Fans one notification out to many device tokens: tokens are de-duplicated,
+    split into provider-sized batches and sent with at most `max_parallel`
+    batches in flight. Tokens the provider reports as invalid are skipped
+    afterwards for a while: they are kept in a bounded LRU for
+    PUSH_INVALID_TOKENS_TTL seconds, long enough to cover callers that
+    resend them before on_invalid_tokens has deleted them from storage.
+    """
+
+    def __init__(self, provider=None, max_parallel=8, on_invalid_tokens=None,
+                 invalid_tokens_size=100000, invalid_tokens_ttl=3600):
+        self.provider = provider or InMemoryPushProvider()
+        self.max_parallel = max_parallel
+        self.on_invalid_tokens = on_invalid_tokens
+        self.invalid_tokens = TTLCache(maxsize=invalid_tokens_size, ttl=invalid_tokens_ttl)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.provider = app.config.get('PUSH_PROVIDER') or self.provider
+        self.max_parallel = app.config.get('PUSH_MAX_PARALLEL', self.max_parallel)
+        self.invalid_tokens = TTLCache(
+            maxsize=app.config.get('PUSH_INVALID_TOKENS_SIZE', self.invalid_tokens.maxsize),
+            ttl=app.config.get('PUSH_INVALID_TOKENS_TTL', self.invalid_tokens.ttl)
+        )
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix='push')
+            return self._executor
+
+    def _send(self, index, tokens, title, message, data):
+        try:
+            results = self.provider.send_batch(tokens, title, message, data)
+        except Exception as exc:
+            return BatchResult(index, len(tokens), 0, len(tokens), [], str(exc))
+        invalid = [token for token, result in zip(tokens, results) if result == INVALID_TOKEN]
+        sent = sum(1 for result in results if result is None)
+        return BatchResult(index, len(tokens), sent, len(tokens) - sent, invalid, None)
+
+    def send(self, tokens, title, message, data=None):
+        """
+        Send to every token and return a per-batch report.
+        """
+        unique = [
+            t for t in dict.fromkeys(tokens) if isinstance(t, str) and t and self.invalid_tokens.get(t) is None
+        ]
+        size = self.provider.max_batch_size
+        batches = [unique[i:i + size] for i in range(0, len(unique), size)]
+        futures = [
+            self._pool().submit(self._send, index, batch, title, message, data)
+            for index, batch in enumerate(batches)
+        ]
+        results = [future.result() for future in futures]
+
+        invalid = [token for result in results for token in result.invalid_tokens]
+        if invalid:
+            for token in invalid:
+                self.invalid_tokens.set(token, True)
+            if self.on_invalid_tokens:
+                self.on_invalid_tokens(invalid)
+        return {
+            'requested': len(tokens),
+            'skipped': len(tokens) - len(unique),
+            'sent': sum(result.sent for result in results),
+            'failed': sum(result.failed for result in results),
+            'invalid_tokens': invalid,
+            'batches': [result._asdict() for result in results],
+        }
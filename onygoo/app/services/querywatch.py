@@ -0,0 +1,185 @@
+import logging
+import os
+import re
+import sys
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\bIN\s*\([^()]*\)", re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+_current = ContextVar('request_statements', default=None)
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+def query_budget(limit):
+    """
+    Cap the number of SQL statements a view may issue while the query
+    watch is enabled. Put it right under the route decorator.
+    """
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+def normalize(statement):
+    """
+    Shape of a statement: literals and IN lists collapsed, so the queries
+    of one N+1 loop normalize to the same string.
+    """
+    statement = _IN_LISTS.sub('IN (?)', _LITERALS.sub('?', statement))
+    return _SPACES.sub(' ', statement).strip()
+
+def _caller():
+    """
+    First frame of our own code below the SQLAlchemy call, as file:line.
+    """
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and filename != __file__ and 'site-packages' not in filename:
+            return f'{os.path.relpath(filename, _ROOT)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+def view_name(view):
+    return f'{view.__module__}.{view.__qualname__}' if view is not None else 'unknown'
+
+class RequestStatements:
+    """
+    Statements issued while handling one request, grouped by shape.
+    """
+    __slots__ = ('view', 'count', 'shapes', 'origins')
+
+    def __init__(self, view):
+        self.view = view
+        self.count = 0
+        self.shapes = {}
+        self.origins = {}
+
+    def record(self, statement):
+        shape = normalize(statement)
+        seen = self.shapes.get(shape, 0) + 1
+        self.shapes[shape] = seen
+        self.count += 1
+        if seen == 2:
+            # Only look up the stack once a shape repeats
+            self.origins[shape] = _caller()
+
+    def repeated(self, threshold):
+        """
+        (shape, count, origin) of shapes issued at least threshold times.
+        """
+        return [
+            (shape, count, self.origins.get(shape))
+            for shape, count in self.shapes.items() if count >= threshold
+        ]
+
+class QueryWatch:
+    """
+    Development and test aid: groups the SQL statements of each request by
+    shape, logs shapes repeated QUERY_NPLUS1_THRESHOLD times or more as
+    likely N+1 loops with the view and line that issued them, and checks
+    the statement count against the view's @query_budget (or
+    QUERY_BUDGET_DEFAULT). With QUERY_BUDGET_STRICT a blown budget raises
+    QueryBudgetExceeded so tests fail. Off unless QUERY_WATCH_ENABLED.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 5
+        self.default_budget = None
+        self.strict = False
+        self.logger = logging.getLogger(__name__)
+        self.last = None
+        self._hooked = False
+
+    def init_app(self, app):
+        from flask import g, request
+
+        self.configure(app.config)
+        self.logger = app.logger
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _watch_queries():
+            g._query_watch = self.start(app.view_functions.get(request.endpoint))
+
+        @app.after_request
+        def _check_queries(response):
+            token = g.pop('_query_watch', None)
+            if token is not None:
+                self.finish(token)
+            return response
+
+        @app.teardown_request
+        def _stop_watching(exc):
+            token = g.pop('_query_watch', None)
+            if token is not None:
+                _current.reset(token)
+
+    def configure(self, config):
+        self.enabled = config.get('QUERY_WATCH_ENABLED', self.enabled)
+        self.threshold = config.get('QUERY_NPLUS1_THRESHOLD', self.threshold)
+        self.default_budget = config.get('QUERY_BUDGET_DEFAULT', self.default_budget)
+        self.strict = config.get('QUERY_BUDGET_STRICT', self.strict)
+        if self.enabled and not self._hooked:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            self._hooked = True
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements = _current.get()
+        if statements is not None:
+            statements.record(statement)
+
+    def start(self, view):
+        return _current.set(RequestStatements(view))
+
+    def finish(self, token):
+        """
+        Stop recording, report N+1 shapes and enforce the budget.
+        Returns the request's RequestStatements.
+        """
+        statements = _current.get()
+        _current.reset(token)
+        self.last = statements
+        name = view_name(statements.view)
+        for shape, count, origin in statements.repeated(self.threshold):
+            self.logger.warning('Possible N+1 in %s: %d x %s (from %s)', name, count, shape, origin or name)
+
+        budget = getattr(statements.view, 'query_budget', self.default_budget)
+        if budget is not None and statements.count > budget:
+            message = f'{name} issued {statements.count} queries, over its budget of {budget}'
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            self.logger.warning(message)
+        return statements
+
+class QueryWatchMiddleware:
+    """
+    ASGI middleware running the query watch for FastAPI requests.
+    """
+
+    def __init__(self, app, watch):
+        self.app = app
+        self.watch = watch
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        token = self.watch.start(None)
+        try:
+            await self.app(scope, receive, send)
+        except BaseException:
+            _current.reset(token)
+            raise
+        # The router stores the matched endpoint in the shared scope
+        _current.get().view = scope.get('endpoint')
+        self.watch.finish(token)
@@ -0,0 +1,122 @@
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import IntegrityError
+from app.models.models import Profile, Rating, Reservation, ReservationStatus, Ride
+
+MIN_SCORE = 1
+MAX_SCORE = 5
+
+class RatingError(Exception):
+    pass
+
+class AlreadyRated(RatingError):
+    pass
+
+class NotOnRide(RatingError):
+    pass
+
+def add_rating_statement(user_id, score):
+    """
+    Fold one score into a profile's aggregate in a single UPDATE.
+    rating is listed first so MySQL, which evaluates SET left to right,
+    computes it from the old sum and count like every other database.
+    """
+    return (
+        update(Profile)
+        .where(Profile.user_id == user_id)
+        .ordered_values(
+            (Profile.rating, (Profile.rating_sum + score) / (Profile.rating_count + 1)),
+            (Profile.rating_sum, Profile.rating_sum + score),
+            (Profile.rating_count, Profile.rating_count + 1),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def _participants(session, ride_id):
+    ride = session.get(Ride, ride_id)
+    if not ride:
+        return set()
+    passengers = session.execute(
+        select(Reservation.passenger_id).where(
+            Reservation.ride_id == ride_id, Reservation.status == ReservationStatus.confirmed
+        )
+    ).scalars()
+    return {ride.driver_id, *passengers}
+
+def rate_user(session, rater_id, ratee_id, ride_id, score):
+    """
+    Record that rater gave ratee `score` for a ride they shared and update
+    the ratee's aggregate in the same transaction.
+    Raises NotOnRide, AlreadyRated or ValueError for a score out of range.
+    """
+    if not MIN_SCORE <= score <= MAX_SCORE:
+        raise ValueError(f'score must be between {MIN_SCORE} and {MAX_SCORE}')
+    participants = _participants(session, ride_id)
+    if rater_id == ratee_id or rater_id not in participants or ratee_id not in participants:
+        raise NotOnRide()
+
+    session.add(Rating(rater_id=rater_id, ratee_id=ratee_id, ride_id=ride_id, score=score))
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        raise AlreadyRated()
+    if session.execute(add_rating_statement(ratee_id, score)).rowcount == 0:
+        # First rating of a user without a profile yet
+        try:
+            with session.begin_nested():
+                session.add(Profile(user_id=ratee_id, rating=score, rating_sum=score, rating_count=1))
+        except IntegrityError:
+            # The profile was created concurrently; fold the score into it
+            session.execute(add_rating_statement(ratee_id, score))
+    session.commit()
+
+def backfill_rating_sums(session):
+    """
+    Fill rating_sum for profiles rated before the column existed, from
+    their average and count, so the next rating extends the right total.
+    Idempotent: scores are at least MIN_SCORE, so a rated profile never
+    has a real sum of 0. Returns the number of profiles fixed.
+    """
+    fixed = session.execute(
+        update(Profile)
+        .where(Profile.rating_count > 0, Profile.rating_sum == 0)
+        .values(rating_sum=func.coalesce(Profile.rating, 0) * Profile.rating_count)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    session.commit()
+    return fixed
+
+def recompute_ratings(session, batch_size=1000):
+    """
+    Rebuild profile aggregates from the ratings table with one GROUP BY pass
+    and batched executemany updates. Legacy sums are backfilled first.
+    Profiles rated more often than they have rows were (partly) rated
+    before the ratings table existed: their aggregate cannot be rebuilt
+    from it and is left alone, as are profiles without any rating row.
+    Returns the number of users whose rows were folded in.
+    """
+    backfill_rating_sums(session)
+    statement = (
+        update(Profile.__table__)
+        .where(
+            Profile.__table__.c.user_id == bindparam('ratee'),
+            func.coalesce(Profile.__table__.c.rating_count, 0) <= bindparam('count')
+        )
+        .values(rating=bindparam('average'), rating_sum=bindparam('total'), rating_count=bindparam('count'))
+    )
+    rows = session.execute(
+        select(Rating.ratee_id, func.sum(Rating.score), func.count()).group_by(Rating.ratee_id)
+    ).all()
+    rated = 0
+    batch = []
+    for ratee_id, total, count in rows:
+        batch.append({'ratee': ratee_id, 'average': total / count, 'total': total, 'count': count})
+        if len(batch) >= batch_size:
+            session.execute(statement, batch)
+            rated += len(batch)
+            batch = []
+    if batch:
+        session.execute(statement, batch)
+        rated += len(batch)
+    session.commit()
+    return rated
@@ -0,0 +1,266 @@
+import heapq
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import List, Optional
+from pydantic import BaseModel, conint, confloat, constr, validator
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from app.models.models import Ride, RideTemplate
+from app.services.locations import location_key_filter
+from app.services.pagination import decode_cursor
+
+class OccurrenceNotFound(Exception):
+    pass
+
+class RideTemplateBase(BaseModel):
+    origin: constr(max_length=255)
+    destination: constr(max_length=255)
+    departure_time: time
+    weekdays: List[conint(ge=0, le=6)]
+    valid_from: date
+    valid_until: Optional[date]
+    seats_available: conint(gt=0)
+    price_per_seat: confloat(ge=0)
+
+    @validator('weekdays')
+    def _at_least_one_day(cls, value):
+        if not value:
+            raise ValueError('at least one weekday is required')
+        return value
+
+    @validator('valid_until')
+    def _ends_after_start(cls, value, values):
+        if value and 'valid_from' in values and value < values['valid_from']:
+            raise ValueError('valid_until is before valid_from')
+        return value
+
+def weekday_mask(weekdays):
+    """
+    Bitmask of a list of weekdays, Monday = 0.
+    """
+    mask = 0
+    for day in weekdays:
+        mask |= 1 << day
+    return mask
+
+def weekday_list(mask):
+    return [day for day in range(7) if mask & (1 << day)]
+
+class Occurrence:
+    """
+    One not yet materialized departure of a template, shaped like a Ride for
+    search results. `id` is the negated template id: it is only used to
+    order occurrences against rides in keyset cursors and is never exposed.
+    """
+    __slots__ = ('template', 'departure_time')
+
+    def __init__(self, template, departure_time):
+        self.template = template
+        self.departure_time = departure_time
+
+    @property
+    def id(self):
+        return -self.template.id
+
+    def to_dict(self):
+        template = self.template
+        return {
+            'id': None,
+            'driver_id': template.driver_id,
+            'origin': template.origin,
+            'destination': template.destination,
+            'departure_time': self.departure_time.isoformat(),
+            'seats_available': template.seats_available,
+            'price_per_seat': template.price_per_seat,
+            'status': 'active',
+            'template_id': template.id
+        }
+
+def sort_key(ride):
+    return ride.departure_time, ride.id
+
+# Keys of Ride.to_dict(), selected as columns by the search fast path
+RIDE_FIELDS = (
+    'id', 'driver_id', 'origin', 'destination', 'departure_time', 'seats_available', 'price_per_seat',
+    'status', 'template_id', 'origin_lat', 'origin_lon', 'destination_lat', 'destination_lon'
+)
+RIDE_COLUMNS = tuple(getattr(Ride, field) for field in RIDE_FIELDS)
+
+def ride_record(ride):
+    """
+    JSON-ready dict of a row of RIDE_COLUMNS or of an Occurrence.
+    """
+    if isinstance(ride, Occurrence):
+        return ride.to_dict()
+    return dict(zip(RIDE_FIELDS, ride))
+
+def occurrence_times(template, start, end):
+    """
+    Yield, in order, the departures of a template in [start, end).
+    """
+    day = max(start.date(), template.valid_from)
+    last = end.date() if template.valid_until is None else min(end.date(), template.valid_until)
+    skipped = {exception.date for exception in template.exceptions}
+    while day <= last:
+        if template.weekdays & (1 << day.weekday()) and day not in skipped:
+            departure = datetime.combine(day, template.departure_time)
+            if start <= departure < end:
+                yield departure
+        day += timedelta(days=1)
+
+def runs_at(template, departure_time):
+    """
+    Whether departure_time is an occurrence of an active template.
+    """
+    if template.status != 'active' or departure_time.time() != template.departure_time:
+        return False
+    return any(True for _ in occurrence_times(template, departure_time, departure_time + timedelta(seconds=1)))
+
+def search_window(date_from=None, date_to=None, horizon_days=60):
+    """
+    [start, end) in which occurrences are expanded for a search: the
+    requested range, or from now on, at most horizon_days long.
+    """
+    start = date_from or datetime.utcnow()
+    end = date_to or start + timedelta(days=horizon_days)
+    return start, min(end, start + timedelta(days=horizon_days))
+
+def templates_statement(origin_keys, destination_keys, start, end):
+    """
+    Active templates matching a search that have occurrences in [start, end).
+    The keys come from location_keys; None means any location.
+    """
+    statement = select(RideTemplate).options(selectinload(RideTemplate.exceptions)).where(
+        RideTemplate.status == 'active',
+        RideTemplate.valid_from <= end.date(),
+        or_(RideTemplate.valid_until.is_(None), RideTemplate.valid_until >= start.date())
+    )
+    if origin_keys is not None:
+        statement = statement.where(location_key_filter(RideTemplate.origin_key, origin_keys))
+    if destination_keys is not None:
+        statement = statement.where(location_key_filter(RideTemplate.destination_key, destination_keys))
+    return statement
+
+def materialized_statement(template_ids, start, end):
+    """
+    (template_id, departure_time) of occurrences that already are rides,
+    whatever their status, so they are not listed twice.
+    """
+    return select(Ride.template_id, Ride.departure_time).where(
+        Ride.template_id.in_(template_ids), Ride.departure_time >= start, Ride.departure_time < end
+    )
+
+def _pending_occurrences(template, start, end, materialized):
+    for departure in occurrence_times(template, start, end):
+        if (template.id, departure) not in materialized:
+            yield Occurrence(template, departure)
+
+def expand(templates, materialized, start, end, cursor=None, limit=None):
+    """
+    Merge the occurrences of templates in [start, end) into one list sorted
+    like rides, skipping materialized ones and those before cursor. With a
+    limit, only the first limit + 1 are expanded.
+    """
+    materialized = set(materialized)
+    after = decode_cursor(cursor) if cursor else None
+    streams = [_pending_occurrences(template, start, end, materialized) for template in templates]
+    merged = heapq.merge(*streams, key=sort_key)
+    if after:
+        merged = (occurrence for occurrence in merged if sort_key(occurrence) > after)
+    if limit is not None:
+        merged = islice(merged, limit + 1)
+    return list(merged)
+
+def search_occurrences(session, origin_keys, destination_keys, start, end, cursor=None, limit=None):
+    templates = session.execute(templates_statement(origin_keys, destination_keys, start, end)).scalars().all()
+    if not templates:
+        return []
+    materialized = session.execute(materialized_statement([t.id for t in templates], start, end)).all()
+    return expand(templates, [tuple(row) for row in materialized], start, end, cursor, limit)
+
+async def search_occurrences_async(session, origin_keys, destination_keys, start, end, cursor=None, limit=None):
+    """
+    search_occurrences for an AsyncSession.
+    """
+    templates = (await session.execute(templates_statement(origin_keys, destination_keys, start, end))).scalars().all()
+    if not templates:
+        return []
+    materialized = (await session.execute(materialized_statement([t.id for t in templates], start, end))).all()
+    return expand(templates, [tuple(row) for row in materialized], start, end, cursor, limit)
+
+def merge_rides(rides, occurrences):
+    """
+    Merge sorted rides and occurrences; feed the result to paginate().
+    """
+    return heapq.merge(rides, occurrences, key=sort_key)
+
+async def amerge_rides(rides, occurrences):
+    """
+    merge_rides for an async iterable of rides.
+    """
+    pending = iter(occurrences)
+    upcoming = next(pending, None)
+    async for ride in rides:
+        while upcoming is not None and sort_key(upcoming) < sort_key(ride):
+            yield upcoming
+            upcoming = next(pending, None)
+        yield ride
+    while upcoming is not None:
+        yield upcoming
+        upcoming = next(pending, None)
+
+def occurrence_statement(template_id):
+    return select(RideTemplate).options(selectinload(RideTemplate.exceptions)).where(RideTemplate.id == template_id)
+
+def occurrence_ride_statement(template_id, departure_time):
+    return select(Ride.id).where(and_(Ride.template_id == template_id, Ride.departure_time == departure_time))
+
+def materialize_statement(template, departure_time):
+    return insert(Ride).values(
+        driver_id=template.driver_id,
+        origin=template.origin,
+        destination=template.destination,
+        origin_key=template.origin_key,
+        destination_key=template.destination_key,
+        departure_time=departure_time,
+        seats_available=template.seats_available,
+        price_per_seat=template.price_per_seat,
+        status='active',
+        template_id=template.id
+    )
+
+def materialize(session, template_id, departure_time):
+    """
+    Return the id of the ride of an occurrence, inserting it if this is its
+    first booking. Nothing is committed, so a failed booking leaves no ride
+    behind. Raises OccurrenceNotFound if the template does not run then.
+    """
+    template = session.execute(occurrence_statement(template_id)).scalar_one_or_none()
+    if template is None or not runs_at(template, departure_time):
+        raise OccurrenceNotFound()
+    ride_id = session.execute(occurrence_ride_statement(template_id, departure_time)).scalar()
+    if ride_id is not None:
+        return ride_id
+    try:
+        return session.execute(materialize_statement(template, departure_time)).inserted_primary_key[0]
+    except IntegrityError:
+        # Another booking materialized it first
+        session.rollback()
+        return session.execute(occurrence_ride_statement(template_id, departure_time)).scalar_one()
+
+async def materialize_async(session, template_id, departure_time):
+    """
+    materialize for an AsyncSession.
+    """
+    template = (await session.execute(occurrence_statement(template_id))).scalar_one_or_none()
+    if template is None or not runs_at(template, departure_time):
+        raise OccurrenceNotFound()
+    ride_id = (await session.execute(occurrence_ride_statement(template_id, departure_time))).scalar()
+    if ride_id is not None:
+        return ride_id
+    try:
+        return (await session.execute(materialize_statement(template, departure_time))).inserted_primary_key[0]
+    except IntegrityError:
+        await session.rollback()
+        return (await session.execute(occurrence_ride_statement(template_id, departure_time))).scalar_one()
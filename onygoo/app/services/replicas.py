@@ -0,0 +1,200 @@
+import random
+import threading
+import time
+from functools import wraps
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from app.services.database import make_engine
+
+# Set on responses of requests that wrote, so that the client's reads
+# stay on the primary until replicas have caught up
+PRIMARY_COOKIE = 'read_primary_until'
+
+def _replication_lag(connection):
+    """
+    Seconds the replica behind connection is behind its primary; None if
+    it is not replicating. Databases without replication report 0.
+    """
+    backend = connection.dialect.name
+    if backend == 'mysql':
+        row = connection.execute(text('SHOW REPLICA STATUS')).mappings().first()
+        if row is None:
+            return None
+        return row.get('Seconds_Behind_Source', row.get('Seconds_Behind_Master'))
+    if backend == 'postgresql':
+        lag = connection.execute(
+            text('SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())')
+        ).scalar()
+        return 0.0 if lag is None else max(float(lag), 0.0)
+    return 0.0
+
+def _mark_write(session):
+    session.info['wrote'] = True
+    scope = session.info.get('asgi_scope')
+    if scope is not None:
+        scope['db_wrote'] = True
+
+def _route_statement(state):
+    """
+    Session do_orm_execute hook: run the SELECTs of a session flagged by a
+    read endpoint on its replica, unless this session already wrote or
+    has pending changes (read-after-write) or the statement locks rows.
+    """
+    session = state.session
+    if not state.is_select:
+        _mark_write(session)
+        return None
+    replica = session.info.get('replica')
+    if replica is None or session.info.get('wrote') or session.new or session.dirty or session.deleted:
+        return None
+    if getattr(state.statement, '_for_update_arg', None) is not None:
+        return None
+    return state.invoke_statement(bind_arguments={'bind': replica})
+
+def _after_flush(session, flush_context):
+    _mark_write(session)
+
+class Replicas:
+    """
+    Routes the reads of endpoints marked read-only to one of the
+    DATABASE_REPLICA_URLS, while writes and everything else stay on the
+    primary. Without replicas configured it does nothing.
+
+    Lag guard: each replica's replication lag is probed at most every
+    REPLICA_LAG_CHECK_INTERVAL seconds, and replicas more than
+    REPLICA_LAG_GUARD_SECONDS behind (or not replicating) are skipped.
+    A request that writes sets a cookie keeping that client's reads on the
+    primary for REPLICA_LAG_GUARD_SECONDS, so booking and then listing
+    reservations sees the booking. Within one request, reads after a write
+    also stay on the primary.
+
+    Locally, two SQLite files stand in for primary and replica: copy the
+    primary file and point DATABASE_REPLICA_URLS at the copy.
+    """
+
+    def __init__(self):
+        self.urls = []
+        self.lag_guard = 5
+        self.check_interval = 5
+        self.engines = []
+        self.checked_at = None
+        self._lags = []
+        self._probes = []
+        self._lock = threading.Lock()
+        self._db = None
+
+    def init_app(self, app, db):
+        """
+        Route Flask-SQLAlchemy's db.session for views decorated with reads.
+        """
+        self.configure(app.config)
+        self._db = db
+        self.engines = [
+            make_engine(dict(app.config, SQLALCHEMY_DATABASE_URI=url), f'flask-replica-{number}')
+            for number, url in enumerate(self.urls)
+        ]
+        if not self.urls:
+            return
+
+        @app.after_request
+        def _stick_to_primary(response):
+            if db.session.info.get('wrote'):
+                response.set_cookie(PRIMARY_COOKIE, self.primary_until(), max_age=self.lag_guard, httponly=True)
+            return response
+
+        @app.teardown_request
+        def _release_replica(exc):
+            db.session.info.pop('replica', None)
+
+    def configure(self, config):
+        self.urls = list(config.get('DATABASE_REPLICA_URLS', self.urls))
+        self.lag_guard = config.get('REPLICA_LAG_GUARD_SECONDS', self.lag_guard)
+        self.check_interval = config.get('REPLICA_LAG_CHECK_INTERVAL', self.check_interval)
+        self._probes = [create_engine(url, poolclass=NullPool) for url in self.urls]
+        self._lags = [0.0] * len(self.urls)
+        self.checked_at = None
+        if self.urls and not event.contains(Session, 'do_orm_execute', _route_statement):
+            event.listen(Session, 'do_orm_execute', _route_statement)
+            event.listen(Session, 'after_flush', _after_flush)
+
+    def primary_until(self):
+        return str(int(time.time() + self.lag_guard) + 1)
+
+    def stale(self):
+        return self.checked_at is None or time.monotonic() - self.checked_at > self.check_interval
+
+    def refresh_lag(self):
+        """
+        Probe every replica's lag; unreachable replicas count as lagging.
+        """
+        lags = []
+        for probe in self._probes:
+            try:
+                with probe.connect() as connection:
+                    lag = _replication_lag(connection)
+            except Exception:
+                lag = None
+            lags.append(float('inf') if lag is None else float(lag))
+        with self._lock:
+            self._lags = lags
+            self.checked_at = time.monotonic()
+        return lags
+
+    def choose(self, engines, primary_until=None):
+        """
+        A replica engine of engines (one per URL) that is within the lag
+        guard, or None to read from the primary.
+        """
+        if not engines:
+            return None
+        if primary_until:
+            try:
+                if float(primary_until) > time.time():
+                    return None
+            except ValueError:
+                pass
+        healthy = [engine for engine, lag in zip(engines, self._lags) if lag <= self.lag_guard]
+        return random.choice(healthy) if healthy else None
+
+    def reads(self, view):
+        """
+        Decorator for Flask views that only read: their queries go to a
+        replica when one is fresh enough.
+        """
+        from flask import request
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.engines:
+                if self.stale():
+                    self.refresh_lag()
+                replica = self.choose(self.engines, request.cookies.get(PRIMARY_COOKIE))
+                if replica is not None:
+                    self._db.session.info['replica'] = replica
+            return view(*args, **kwargs)
+        return wrapper
+
+class PrimaryCookieMiddleware:
+    """
+    ASGI counterpart of the Flask after_request hook: sets the primary
+    cookie on responses of requests whose sessions wrote.
+    """
+
+    def __init__(self, app, replicas):
+        self.app = app
+        self.replicas = replicas
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        async def send_cookie(message):
+            if message['type'] == 'http.response.start' and scope.get('db_wrote'):
+                cookie = f'{PRIMARY_COOKIE}={self.replicas.primary_until()}; Max-Age={self.replicas.lag_guard}; Path=/; HttpOnly'
+                message['headers'] = list(message.get('headers', [])) + [(b'set-cookie', cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_cookie)
@@ -0,0 +1,181 @@
+import csv
+import json
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel, ValidationError, constr, conint, confloat
+from app.models.models import Ride
+from app.services.locations import normalize_location, register_location_keys, register_location_keys_async
+
+IMPORT_CHUNK_SIZE = 1000
+# Errors beyond this are counted but not listed, to bound the response size
+MAX_REPORTED_ERRORS = 1000
+FIELDS = ('origin', 'destination', 'departure_time', 'seats_available', 'price_per_seat')
+
+class RideBase(BaseModel):
+    origin: constr(max_length=255)
+    destination: constr(max_length=255)
+    departure_time: datetime
+    seats_available: conint(gt=0)
+    price_per_seat: confloat(ge=0)
+    origin_lat: Optional[confloat(ge=-90, le=90)]
+    origin_lon: Optional[confloat(ge=-180, le=180)]
+    destination_lat: Optional[confloat(ge=-90, le=90)]
+    destination_lon: Optional[confloat(ge=-180, le=180)]
+
+class RideImporter:
+    """
+    Turns the lines of a CSV (with a header row) or NDJSON upload into
+    validated rides table rows, one record per line. feed() returns a chunk
+    of rows to executemany() whenever chunk_size rows are ready and finish()
+    returns the rest, so the caller can stream the body and still insert
+    everything in a single transaction. Invalid lines are reported, not fatal.
+    """
+
+    def __init__(self, driver_id, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+        if fmt not in ('csv', 'ndjson'):
+            raise ValueError(f'Unsupported format: {fmt}')
+        self.driver_id = driver_id
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+        self.header = None
+        self.line_no = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self._chunk = []
+
+    def feed(self, line):
+        self.line_no += 1
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8-sig' if self.line_no == 1 else 'utf-8')
+            if not line.strip():
+                return None
+            record = self._parse(line)
+        except ValueError as exc:
+            self._error(str(exc))
+            return None
+        if record is None:
+            return None
+        try:
+            ride = RideBase(**record)
+        except ValidationError as exc:
+            self._error('; '.join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors()))
+            return None
+        self._chunk.append({
+            'driver_id': self.driver_id,
+            'origin': ride.origin,
+            'destination': ride.destination,
+            'origin_key': normalize_location(ride.origin),
+            'destination_key': normalize_location(ride.destination),
+            'departure_time': ride.departure_time,
+            'seats_available': ride.seats_available,
+            'price_per_seat': ride.price_per_seat,
+            'status': 'active',
+            'origin_lat': ride.origin_lat,
+            'origin_lon': ride.origin_lon,
+            'destination_lat': ride.destination_lat,
+            'destination_lon': ride.destination_lon,
+        })
+        if len(self._chunk) >= self.chunk_size:
+            return self._take()
+        return None
+
+    def finish(self):
+        return self._take()
+
+    def report(self):
+        return {
+            'imported': self.imported,
+            'rejected': self.error_count,
+            'errors': self.errors,
+        }
+
+    def _parse(self, line):
+        if self.fmt == 'ndjson':
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError('Expected a JSON object')
+            return record
+        values = next(csv.reader([line]))
+        if self.header is None:
+            self.header = [name.strip() for name in values]
+            missing = set(FIELDS) - set(self.header)
+            if missing:
+                raise ValueError(f"Header is missing {', '.join(sorted(missing))}")
+            return None
+        if len(values) != len(self.header):
+            raise ValueError(f'Expected {len(self.header)} columns, got {len(values)}')
+        return dict(zip(self.header, values))
+
+    def _error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': self.line_no, 'error': message})
+
+    def _take(self):
+        chunk, self._chunk = self._chunk, []
+        self.imported += len(chunk)
+        return chunk
+
+def _chunk_keys(chunk):
+    return {row[column] for row in chunk for column in ('origin_key', 'destination_key')}
+
+def import_rides(session, driver_id, lines, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Insert the rides of an iterable of lines with one executemany() per
+    chunk. Nothing is committed; returns the importer report.
+    """
+    importer = RideImporter(driver_id, fmt, chunk_size)
+    for line in lines:
+        chunk = importer.feed(line)
+        if chunk:
+            session.execute(Ride.__table__.insert(), chunk)
+            register_location_keys(session.connection(), _chunk_keys(chunk))
+    chunk = importer.finish()
+    if chunk:
+        session.execute(Ride.__table__.insert(), chunk)
+        register_location_keys(session.connection(), _chunk_keys(chunk))
+    return importer.report()
+
+async def import_rides_async(session, driver_id, lines, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Same as import_rides for an AsyncSession and an async iterable of lines.
+    """
+    importer = RideImporter(driver_id, fmt, chunk_size)
+    async for line in lines:
+        chunk = importer.feed(line)
+        if chunk:
+            await session.execute(Ride.__table__.insert(), chunk)
+            await register_location_keys_async(await session.connection(), _chunk_keys(chunk))
+    chunk = importer.finish()
+    if chunk:
+        await session.execute(Ride.__table__.insert(), chunk)
+        await register_location_keys_async(await session.connection(), _chunk_keys(chunk))
+    return importer.report()
+
+def import_format(content_type, requested=None):
+    """
+    Pick 'csv' or 'ndjson' from an explicit format parameter or the Content-Type.
+    """
+    if requested:
+        return requested.lower()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        return 'ndjson'
+    return None
+
+async def aiter_lines(chunks):
+    """
+    Split an async iterable of byte chunks (a request body) into lines.
+    """
+    pending = b''
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
@@ -0,0 +1,47 @@
+import threading
+import time
+
+class Scheduler:
+    """
+    Minimal in-process scheduler running periodic jobs on one daemon thread,
+    each inside an app context. Only started when SCHEDULER_ENABLED is set,
+    so that exactly one process per deployment runs the jobs.
+    """
+
+    def __init__(self, tick=1.0):
+        self.app = None
+        self.tick = tick
+        self.jobs = {}
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self.app = app
+        if app.config.get('SCHEDULER_ENABLED'):
+            self.start()
+
+    def add_job(self, name, fn, interval):
+        self.jobs[name] = {'fn': fn, 'interval': interval, 'next_run': time.monotonic() + interval}
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            now = time.monotonic()
+            for name, job in list(self.jobs.items()):
+                if job['next_run'] > now:
+                    continue
+                job['next_run'] = now + job['interval']
+                with self.app.app_context():
+                    try:
+                        job['fn']()
+                    except Exception:
+                        self.app.logger.exception('Scheduled job %s failed', name)
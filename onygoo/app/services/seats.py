@@ -0,0 +1,112 @@
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from app.models.models import Ride, Reservation, ReservationStatus
+
+class BookingError(Exception):
+    pass
+
+class NoSeatsAvailable(BookingError):
+    pass
+
+class AlreadyBooked(BookingError):
+    pass
+
+class AlreadyCancelled(BookingError):
+    pass
+
+def claim_seat_statement(ride_id):
+    """
+    Take one seat on an active ride, only if one is left.
+    The check and the decrement happen in a single UPDATE, so concurrent
+    bookings can never oversell; rowcount tells whether the seat was claimed.
+    """
+    return (
+        update(Ride)
+        .where(Ride.id == ride_id, Ride.status == 'active', Ride.seats_available > 0)
+        .values(seats_available=Ride.seats_available - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def release_seat_statement(ride_id):
+    """
+    Give one seat back to a ride.
+    """
+    return (
+        update(Ride)
+        .where(Ride.id == ride_id)
+        .values(seats_available=Ride.seats_available + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def cancel_reservation_statement(reservation_id):
+    """
+    Mark a reservation cancelled unless it already is; rowcount is 0 when
+    another request cancelled it first, so its seat is released only once.
+    """
+    return (
+        update(Reservation)
+        .where(Reservation.id == reservation_id, Reservation.status != ReservationStatus.cancelled)
+        .values(status=ReservationStatus.cancelled)
+        .execution_options(synchronize_session=False)
+    )
+
+def reserve_seat(session, passenger_id, ride_id):
+    """
+    Claim a seat and create its pending reservation in one transaction.
+    The conditional UPDATE runs first and takes the ride row's exclusive
+    lock straight away: inserting the reservation first would take a
+    shared lock on the ride through the foreign key check, and two
+    bookings upgrading their shared locks deadlock on InnoDB. A duplicate
+    booking rolls back, which also gives the seat back.
+    Raises NoSeatsAvailable or AlreadyBooked.
+    """
+    if session.execute(claim_seat_statement(ride_id)).rowcount != 1:
+        session.rollback()
+        raise NoSeatsAvailable()
+    reservation = Reservation(passenger_id=passenger_id, ride_id=ride_id, status=ReservationStatus.pending)
+    session.add(reservation)
+    try:
+        session.flush()
+    except IntegrityError:
+        session.rollback()
+        raise AlreadyBooked()
+    session.commit()
+    return reservation
+
+def cancel_reservation(session, reservation):
+    """
+    Cancel a reservation and release its seat in one transaction.
+    Raises AlreadyCancelled if it was cancelled concurrently.
+    """
+    if session.execute(cancel_reservation_statement(reservation.id)).rowcount != 1:
+        session.rollback()
+        raise AlreadyCancelled()
+    session.execute(release_seat_statement(reservation.ride_id))
+    session.commit()
+
+async def reserve_seat_async(session, passenger_id, ride_id):
+    """
+    reserve_seat for an AsyncSession.
+    """
+    if (await session.execute(claim_seat_statement(ride_id))).rowcount != 1:
+        await session.rollback()
+        raise NoSeatsAvailable()
+    reservation = Reservation(passenger_id=passenger_id, ride_id=ride_id, status=ReservationStatus.pending)
+    session.add(reservation)
+    try:
+        await session.flush()
+    except IntegrityError:
+        await session.rollback()
+        raise AlreadyBooked()
+    await session.commit()
+    return reservation
+
+async def cancel_reservation_async(session, reservation):
+    """
+    cancel_reservation for an AsyncSession.
+    """
+    if (await session.execute(cancel_reservation_statement(reservation.id))).rowcount != 1:
+        await session.rollback()
+        raise AlreadyCancelled()
+    await session.execute(release_seat_statement(reservation.ride_id))
+    await session.commit()
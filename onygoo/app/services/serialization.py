@@ -0,0 +1,31 @@
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder produces the same JSON, slower
+    orjson = None
+
+def _default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def dumps(value):
+    """
+    Compact JSON as bytes, with orjson when it is installed. Datetimes are
+    written like datetime.isoformat(), as the to_dict() methods do.
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(',', ':')).encode()
+
+def records(fields, rows):
+    """
+    Dicts of fields for column tuples selected in that order; the fast
+    path of list endpoints instead of ORM instances and to_dict().
+    """
+    return [dict(zip(fields, row)) for row in rows]
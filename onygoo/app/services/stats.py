@@ -0,0 +1,59 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.models import User, Ride, Reservation, Payment, StatCounter
+
+def compute_stats(session):
+    """
+    Recompute every dashboard statistic with one GROUP BY per table.
+    """
+    stats = defaultdict(float)
+    for role, is_active, count in session.execute(
+        select(User.role, User.is_active, func.count()).group_by(User.role, User.is_active)
+    ):
+        stats['users.total'] += count
+        stats[f'users.role.{role.value}'] += count
+        stats['users.active' if is_active else 'users.inactive'] += count
+    for status, count in session.execute(select(Ride.status, func.count()).group_by(Ride.status)):
+        stats['rides.total'] += count
+        stats[f'rides.status.{status}'] += count
+    for status, count in session.execute(select(Reservation.status, func.count()).group_by(Reservation.status)):
+        stats['reservations.total'] += count
+        stats[f'reservations.status.{status.value}'] += count
+    stats['revenue.completed'] = session.execute(
+        select(func.coalesce(func.sum(Payment.amount), 0)).where(Payment.status == 'completed')
+    ).scalar_one()
+    return dict(stats)
+
+def refresh_stats(session):
+    """
+    Replace the stat_counters rollup with freshly computed values.
+    When another refresh commits the same counter names first (the job in
+    another worker, or the CLI command), its rollup is kept and ours is dropped.
+    """
+    stats = compute_stats(session)
+    now = datetime.utcnow()
+    session.execute(delete(StatCounter))
+    session.add_all(StatCounter(name=name, value=value, updated_at=now) for name, value in stats.items())
+    try:
+        session.commit()
+    except IntegrityError:
+        session.rollback()
+    return stats
+
+def load_stats(session):
+    """
+    Read the rollup; returns (stats, refreshed_at), or ({}, None) if it was never built.
+    """
+    rows = session.execute(select(StatCounter.name, StatCounter.value, StatCounter.updated_at)).all()
+    if not rows:
+        return {}, None
+    return {row.name: row.value for row in rows}, min(row.updated_at for row in rows)
+
+def refresh_stats_job():
+    """
+    Scheduler entry point.
+    """
+    return refresh_stats(db.session)
@@ -0,0 +1,39 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, select
+from app.extensions import db
+from app.models.models import EmailVerificationToken, PasswordResetToken
+
+TOKEN_MODELS = (EmailVerificationToken, PasswordResetToken)
+
+def purge_expired_tokens(session, batch_size=1000, now=None):
+    """
+    Delete expired verification and reset tokens, at most batch_size rows
+    per transaction so no statement holds its locks for long.
+    Returns {table name: rows purged}.
+    """
+    now = now or datetime.utcnow()
+    purged = {}
+    for model in TOKEN_MODELS:
+        purged[model.__tablename__] = 0
+        while True:
+            ids = session.execute(
+                select(model.id).where(model.expires_at < now).order_by(model.expires_at).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            session.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+            session.commit()
+            purged[model.__tablename__] += len(ids)
+            if len(ids) < batch_size:
+                break
+    return purged
+
+def purge_expired_tokens_job():
+    """
+    Scheduler entry point.
+    """
+    purged = purge_expired_tokens(db.session, current_app.config['TOKEN_SWEEP_BATCH_SIZE'])
+    if any(purged.values()):
+        current_app.logger.info('Purged expired tokens: %s', purged)
+    return purged
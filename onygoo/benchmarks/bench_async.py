@@ -0,0 +1,106 @@
+"""
+Sync (threadpool) vs async ride search on FastAPI at high concurrency.
+
+    python benchmarks/bench_async.py --rows 50000 --concurrency 200 --requests 5000
+
+Both variants run the same keyset search against the same SQLite file: the
+sync one the way the routers used to work (a `def` endpoint with a blocking
+session, executed in Starlette's threadpool), the async one through the real
+rides router on aiosqlite. Requests are driven in-process over httpx's ASGI
+transport, so the numbers compare the two code paths rather than a network
+stack. The search cache is disabled for the run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+WORKDIR = tempfile.mkdtemp(prefix='onygoo-bench-')
+DATABASE_URL = 'sqlite:///' + os.path.join(WORKDIR, 'async.db')
+# fastapi_app.db builds its engine from DATABASE_URL at import time
+os.environ['DATABASE_URL'] = DATABASE_URL
+
+from common import CITIES, ride_rows, insert_in_chunks, summarize
+
+import httpx
+from fastapi import FastAPI, Query
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from app.extensions import db, search_cache
+from app.models.models import Ride
+from app.services.locations import index_location_keys, location_key_filter, location_keys
+from app.services.pagination import DEFAULT_PAGE_SIZE, apply_keyset, paginate
+from fastapi_app.api import rides
+
+def build_sync_app(engine):
+    Session = sessionmaker(bind=engine)
+    app = FastAPI()
+
+    @app.get("/rides/")
+    def search_rides(origin: str, destination: str, limit: int = Query(DEFAULT_PAGE_SIZE)):
+        with Session() as session:
+            origin_keys, destination_keys = location_keys(session, origin, destination)
+            statement = select(Ride).where(
+                Ride.status == 'active',
+                location_key_filter(Ride.origin_key, origin_keys),
+                location_key_filter(Ride.destination_key, destination_keys)
+            )
+            statement = apply_keyset(statement, Ride.departure_time, Ride.id, None, limit)
+            page, next_cursor = paginate(session.execute(statement).scalars(), limit, 'departure_time')
+            return {"rides": [ride.to_dict() for ride in page], "next_cursor": next_cursor}
+
+    return app
+
+def build_async_app():
+    app = FastAPI()
+    app.include_router(rides.router, prefix="/rides")
+    return app
+
+async def drive(app, total, concurrency, seed):
+    rng = random.Random(seed)
+    pairs = [rng.sample(CITIES, 2) for _ in range(total)]
+    samples = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        queue = iter(pairs)
+
+        async def worker():
+            for origin, destination in queue:
+                started = time.perf_counter()
+                response = await client.get('/rides/', params={'origin': origin, 'destination': destination})
+                samples.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return dict(requests_per_sec=round(total / elapsed, 1), **summarize(samples))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False})
+    db.Model.metadata.create_all(engine)
+    with engine.begin() as connection:
+        insert_in_chunks(connection, Ride.__table__, ride_rows(args.rows))
+        index_location_keys(connection)
+    search_cache.configure({'SEARCH_CACHE_SIZE': 0, 'SEARCH_CACHE_TTL': 0})
+
+    report = {
+        'benchmark': 'fastapi_sync_vs_async',
+        'rows': args.rows,
+        'concurrency': args.concurrency,
+        'sync': asyncio.run(drive(build_sync_app(engine), args.requests, args.concurrency, seed=1)),
+        'async': asyncio.run(drive(build_async_app(), args.requests, args.concurrency, seed=1)),
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
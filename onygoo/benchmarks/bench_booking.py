@@ -0,0 +1,95 @@
+"""
+Concurrent booking of a single hot ride.
+
+    python benchmarks/bench_booking.py --threads 32 --attempts 2000 --seats 500
+
+Every attempt books one seat for a distinct passenger through
+app.services.seats.reserve_seat. The run fails if more reservations are
+created than the ride had seats, or if seats_available goes negative.
+Point --database-url at MySQL to measure real row contention; the default
+SQLite file serializes writers and mostly measures its lock timeout.
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from common import summarize
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from app.extensions import db
+from app.models.models import Ride, Reservation
+from app.services.seats import reserve_seat, BookingError
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=2000)
+    parser.add_argument('--seats', type=int, default=500)
+    args = parser.parse_args()
+
+    url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='onygoo-bench-'), 'booking.db')
+    connect_args = {'timeout': 30, 'check_same_thread': False} if url.startswith('sqlite') else {}
+    engine = create_engine(url, connect_args=connect_args, pool_size=args.threads, max_overflow=0)
+    db.Model.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as session:
+        ride = Ride(driver_id=1, origin='Dakar', destination='Thiès', departure_time=datetime(2030, 1, 1, 8),
+                    seats_available=args.seats, price_per_seat=10.0, status='active')
+        session.add(ride)
+        session.commit()
+        ride_id = ride.id
+
+    outcomes = {'booked': 0, 'rejected': 0}
+    lock = threading.Lock()
+
+    def attempt(passenger_id):
+        started = time.perf_counter()
+        with Session() as session:
+            try:
+                reserve_seat(session, passenger_id, ride_id)
+                outcome = 'booked'
+            except BookingError:
+                outcome = 'rejected'
+        with lock:
+            outcomes[outcome] += 1
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        samples = list(pool.map(attempt, range(1, args.attempts + 1)))
+    elapsed = time.perf_counter() - started
+
+    with Session() as session:
+        seats_left = session.execute(select(Ride.seats_available).where(Ride.id == ride_id)).scalar_one()
+        reservations = session.execute(
+            select(func.count()).select_from(Reservation).where(Reservation.ride_id == ride_id)
+        ).scalar_one()
+
+    expected = min(args.seats, args.attempts)
+    report = {
+        'benchmark': 'booking_contention',
+        'threads': args.threads,
+        'attempts': args.attempts,
+        'seats': args.seats,
+        'booked': outcomes['booked'],
+        'rejected': outcomes['rejected'],
+        'reservations_in_db': reservations,
+        'seats_left': seats_left,
+        'oversold': reservations - args.seats if reservations > args.seats else 0,
+        'attempts_per_sec': round(args.attempts / elapsed, 1),
+        'latency': summarize(samples),
+    }
+    print(json.dumps(report, indent=2))
+    if reservations != expected or seats_left != args.seats - expected or outcomes['booked'] != expected:
+        raise SystemExit('seat inventory is inconsistent')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Bulk ride import throughput.
+
+    python benchmarks/bench_import.py --rides 100000 --format csv
+
+Builds a CSV or NDJSON upload of --rides random rides (with a fraction of
+invalid lines) and imports it through app.services.ride_import.import_rides
+in one transaction, as POST /rides/import does. For comparison a sample of
+--baseline rides is inserted the way propose_ride does it: one ORM add and
+one commit per ride.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import ride_rows
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from app.extensions import db
+from app.models.models import Ride
+from app.services.ride_import import FIELDS, import_rides
+
+def upload_lines(count, fmt, invalid_ratio, seed=42):
+    """
+    Encoded lines of an upload, as a streamed request body would deliver them.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for row in ride_rows(count, seed=seed):
+        record = {field: row[field] for field in FIELDS}
+        record['departure_time'] = record['departure_time'].isoformat()
+        if rng.random() < invalid_ratio:
+            record['seats_available'] = 0
+        rows.append(record)
+    if fmt == 'ndjson':
+        return [(json.dumps(record) + '\n').encode() for record in rows]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return [line.encode() for line in buffer.getvalue().splitlines(keepends=True)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--rides', type=int, default=100000)
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--invalid-ratio', type=float, default=0.01)
+    parser.add_argument('--baseline', type=int, default=2000)
+    args = parser.parse_args()
+
+    url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='onygoo-bench-'), 'import.db')
+    engine = create_engine(url)
+    db.Model.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    lines = upload_lines(args.rides, args.format, args.invalid_ratio)
+
+    with Session() as session:
+        started = time.perf_counter()
+        report = import_rides(session, 1, iter(lines), args.format, args.chunk_size)
+        session.commit()
+        bulk_elapsed = time.perf_counter() - started
+        stored = session.execute(select(func.count()).select_from(Ride)).scalar_one()
+
+    with Session() as session:
+        started = time.perf_counter()
+        for row in ride_rows(args.baseline, driver_id=2, seed=7):
+            session.add(Ride(**{key: value for key, value in row.items() if not key.endswith('_key')}))
+            session.commit()
+        baseline_elapsed = time.perf_counter() - started
+
+    bulk_rate = report['imported'] / bulk_elapsed
+    baseline_rate = args.baseline / baseline_elapsed
+    print(json.dumps({
+        'benchmark': 'ride_import',
+        'format': args.format,
+        'lines': len(lines),
+        'imported': report['imported'],
+        'rejected': report['rejected'],
+        'rows_in_db': stored,
+        'chunk_size': args.chunk_size,
+        'bulk_seconds': round(bulk_elapsed, 3),
+        'bulk_rides_per_sec': round(bulk_rate, 1),
+        'per_request_rides_per_sec': round(baseline_rate, 1),
+        'speedup': round(bulk_rate / baseline_rate, 1),
+    }, indent=2))
+    if stored != report['imported']:
+        raise SystemExit('imported count does not match the rides table')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Push fan-out throughput against the in-memory provider.
+
+    python benchmarks/bench_push.py --tokens 1000000 --latency 0.05 --parallel 1 8 32
+
+Each batch request sleeps `latency` seconds to stand in for the provider
+round trip, so tokens/sec shows how bounded parallelism hides that latency.
+"""
+import argparse
+import json
+import time
+
+import common  # noqa: F401  (puts the app on sys.path)
+
+from app.services.push import InMemoryPushProvider, PushFanout
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tokens', type=int, default=1000000)
+    parser.add_argument('--invalid-every', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--parallel', type=int, nargs='+', default=[1, 8, 32])
+    args = parser.parse_args()
+
+    tokens = [f'device-{i}' for i in range(args.tokens)]
+    invalid = tokens[::args.invalid_every]
+    results = []
+    for parallel in args.parallel:
+        provider = InMemoryPushProvider(invalid, args.latency, args.batch_size)
+        fanout = PushFanout(provider, max_parallel=parallel)
+        started = time.perf_counter()
+        report = fanout.send(tokens, 'Ride cancelled', 'Your ride has been cancelled')
+        elapsed = time.perf_counter() - started
+        assert report['sent'] == len(tokens) - len(invalid)
+        assert len(report['invalid_tokens']) == len(invalid)
+        results.append({
+            'parallel': parallel,
+            'batches': len(report['batches']),
+            'seconds': round(elapsed, 3),
+            'tokens_per_sec': round(len(tokens) / elapsed, 1),
+        })
+    print(json.dumps({'benchmark': 'push_fanout', 'tokens': args.tokens, 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
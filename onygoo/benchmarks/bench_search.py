@@ -0,0 +1,79 @@
+"""
+Ride search latency as the rides table grows.
+
+    python benchmarks/bench_search.py --sizes 10000 100000 1000000
+
+The table is grown in place between sizes and each size runs the same set of
+origin/destination searches through the Flask test client. The searched
+prefixes resolve to keys in location_tokens and each key pair is an index
+seek on ix_rides_search, so the uncached p50 should stay roughly flat from
+10k to 1M rows. Searches are timed twice: uncached, with the search cache cleared
+before every request, and cached, once every page has been cached.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+from common import CITIES, make_config, ride_rows, insert_in_chunks, timed, summarize
+
+from app import create_app
+from app.extensions import db, search_cache
+from app.models.models import Ride
+from app.services.locations import index_location_keys
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='onygoo-bench-')
+    app = create_app(make_config('sqlite:///' + os.path.join(workdir, 'search.db')))
+    client = app.test_client()
+    rng = random.Random(7)
+    # A date keeps the result set small so the timing reflects the lookup, not serialization
+    pairs = [rng.sample(CITIES, 2) + [(date(2030, 1, 1) + timedelta(days=rng.randrange(365))).isoformat()]
+             for _ in range(args.queries)]
+
+    results = []
+    with app.app_context():
+        db.create_all()
+        rows_loaded = 0
+        for size in sorted(args.sizes):
+            with db.engine.begin() as connection:
+                insert_in_chunks(connection, Ride.__table__, ride_rows(size - rows_loaded, seed=size))
+                index_location_keys(connection)
+            rows_loaded = size
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql('ANALYZE')
+
+            queries = iter(pairs * 2)
+
+            def search():
+                origin, destination, day = next(queries)
+                response = client.get('/rides/search', query_string={
+                    'origin': origin, 'destination': destination, 'date': day
+                })
+                assert response.status_code == 200, response.status_code
+
+            def uncached_search():
+                search_cache.clear()
+                search()
+
+            # Rows were inserted behind the cache's back: start this size empty
+            search_cache.clear()
+            # Warm SQLite's page cache with one pass before sampling
+            timed(uncached_search, len(pairs))
+            uncached = summarize(timed(uncached_search, len(pairs)))
+            queries = iter(pairs * 2)
+            timed(search, len(pairs))
+            cached = summarize(timed(search, len(pairs)))
+            results.append({'rows': size, 'uncached': uncached, 'cached': cached})
+
+    print(json.dumps({'benchmark': 'ride_search', 'results': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Serialization cost of ride search pages, per 1000 rows.
+
+    python benchmarks/bench_serialize.py --rows 1000 10000 --repeat 20
+
+Loads --rows active rides into SQLite and times, for each size, the full
+query + encode of one result list three ways:
+
+- flask_orm: ORM instances, Ride.to_dict() and json.dumps, as the Flask
+  search did through jsonify
+- fastapi_orm: ORM instances validated into RideSearchPage with orm_mode
+  and encoded with jsonable_encoder + json.dumps, as FastAPI's
+  response_model did
+- fast_path: RIDE_COLUMNS tuples, ride_record() and
+  app.services.serialization.dumps (orjson when installed), as both
+  stacks do now
+
+Times are reported as mean ms per 1000 rows.
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from common import insert_in_chunks, ride_rows, summarize, timed
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models.models import Ride
+from app.services import serialization
+from app.services.recurring import RIDE_COLUMNS, ride_record
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi_app.api.rides import RideSearchPage
+
+    workdir = tempfile.mkdtemp(prefix='onygoo-bench-')
+    engine = create_engine('sqlite:///' + os.path.join(workdir, 'serialize.db'))
+    db.Model.metadata.create_all(engine)
+    with engine.begin() as connection:
+        rows = [dict(row, status='active') for row in ride_rows(max(args.rows))]
+        insert_in_chunks(connection, Ride.__table__, rows)
+
+    results = []
+    for size in sorted(args.rows):
+        orm_statement = select(Ride).order_by(Ride.departure_time, Ride.id).limit(size)
+        column_statement = select(*RIDE_COLUMNS).order_by(Ride.departure_time, Ride.id).limit(size)
+
+        def flask_orm():
+            with Session(engine) as session:
+                rides = session.execute(orm_statement).scalars()
+                json.dumps({'rides': [ride.to_dict() for ride in rides], 'next_cursor': None})
+
+        def fastapi_orm():
+            with Session(engine) as session:
+                rides = session.execute(orm_statement).scalars().all()
+                json.dumps(jsonable_encoder(RideSearchPage(rides=rides, next_cursor=None)))
+
+        def fast_path():
+            with Session(engine) as session:
+                rides = session.execute(column_statement)
+                serialization.dumps({'rides': [ride_record(ride) for ride in rides], 'next_cursor': None})
+
+        per_1k = 1000 / size
+        timings = {}
+        for name, fn in (('flask_orm', flask_orm), ('fastapi_orm', fastapi_orm), ('fast_path', fast_path)):
+            timed(fn, 2)
+            summary = summarize(timed(fn, args.repeat))
+            timings[name] = round(summary['mean_ms'] * per_1k, 3)
+        results.append({
+            'rows': size,
+            'ms_per_1k_rows': timings,
+            'speedup_vs_flask': round(timings['flask_orm'] / timings['fast_path'], 1),
+            'speedup_vs_fastapi': round(timings['fastapi_orm'] / timings['fast_path'], 1),
+        })
+
+    print(json.dumps({
+        'benchmark': 'serialize',
+        'encoder': 'orjson' if serialization.orjson is not None else 'json',
+        'results': results,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Benchmarks are run as scripts from the onygoo/ directory or the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TestingConfig
+from app.services.locations import normalize_location
+
+CITIES = [
+    'Paris', 'Lyon', 'Marseille', 'Toulouse', 'Nice', 'Nantes', 'Strasbourg',
+    'Montpellier', 'Bordeaux', 'Lille', 'Rennes', 'Reims', 'Saint-Étienne',
+    'Le Havre', 'Grenoble', 'Dijon', 'Angers', 'Nîmes', 'Clermont-Ferrand', 'Brest',
+    'Dakar', 'Thiès', 'Saint-Louis', 'Ziguinchor', 'Kaolack', 'Mbour', 'Touba',
+]
+
+def make_config(database_uri):
+    """
+    Build a TestingConfig subclass pointing at the given database.
+    """
+    return type('BenchmarkConfig', (TestingConfig,), {'SQLALCHEMY_DATABASE_URI': database_uri})
+
+def ride_rows(count, driver_id=1, seed=42, start=None):
+    """
+    Yield insert parameter dicts for `count` random active rides.
+    """
+    rng = random.Random(seed)
+    start = start or datetime(2030, 1, 1)
+    for _ in range(count):
+        origin, destination = rng.sample(CITIES, 2)
+        yield {
+            'driver_id': driver_id,
+            'origin': origin,
+            'destination': destination,
+            'origin_key': normalize_location(origin),
+            'destination_key': normalize_location(destination),
+            'departure_time': start + timedelta(minutes=rng.randrange(60 * 24 * 365)),
+            'seats_available': rng.randint(1, 4),
+            'price_per_seat': float(rng.randint(5, 60)),
+            'status': rng.choice(['active'] * 8 + ['cancelled', 'completed']),
+        }
+
+def insert_in_chunks(connection, table, rows, chunk_size=10000):
+    """
+    executemany() rows into table in fixed-size chunks.
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            connection.execute(table.insert(), chunk)
+            chunk = []
+    if chunk:
+        connection.execute(table.insert(), chunk)
+
+def timed(fn, repeat):
+    """
+    Call fn `repeat` times and return the list of wall-clock durations in ms.
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def summarize(samples):
+    """
+    Return p50/p95/p99 and mean of a list of millisecond samples.
+    """
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 3)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+    }
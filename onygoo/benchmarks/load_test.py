@@ -0,0 +1,383 @@
+"""
+Load test of the Flask and FastAPI stacks on the same seeded SQLite data.
+
+    python benchmarks/load_test.py --stacks flask fastapi --concurrency 16 --duration 30 \\
+        --mix search=60,book=15,confirm=8,cancel=7,history=10 --output results.json
+
+For each stack a fresh SQLite file is seeded (drivers, one passenger per
+virtual user, --rides rides), the app is started in a child process
+(Werkzeug's threaded server for Flask, uvicorn for FastAPI) and
+--concurrency virtual users loop over the weighted mix for --duration
+seconds after --warmup. Each user books rides found by its own searches
+and confirms or cancels its own pending reservations.
+
+The report has throughput, successes, errors and p50/p95/p99 latency per
+endpoint. Statuses outside EXPECTED count as errors. The run exits
+non-zero if an endpoint of the mix never succeeded or has an error rate
+above --max-error-rate, and, with --baseline, if the p95 of any endpoint
+grew by more than --tolerance, so it can gate regressions.
+Everything is seeded from --seed, so runs are comparable.
+
+Flask answers form posts with redirects, so its book/confirm/cancel count
+as successful whenever they redirect; its pending reservations are learnt
+from the ride history. FastAPI has no ride history endpoint, so that part
+of the mix is skipped there.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+
+# config is read at import time; the server child gets the real DATABASE_URL in its
+# environment, this only keeps the parent's FastAPI import (for tokens) off MySQL
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'onygoo-load-unused.db'))
+
+from common import CITIES, insert_in_chunks, make_config, ride_rows, summarize
+
+DRIVERS = 20
+ENDPOINTS = ('search', 'book', 'confirm', 'cancel', 'history')
+# Statuses that are normal outcomes under load; anything else is an error.
+# Booking a ride whose last seat another user just took answers 400.
+EXPECTED = {
+    'search': {200},
+    'book': {201, 302, 400},
+    'confirm': {200, 302},
+    'cancel': {200, 302},
+    'history': {200},
+}
+
+def serve(stack, database_url, port):
+    """
+    Child process entry point: run one stack until killed.
+    """
+    if stack == 'flask':
+        from werkzeug.serving import run_simple
+        from app import create_app
+
+        app = create_app(make_config(database_url))
+        run_simple('127.0.0.1', port, app, threaded=True)
+    else:
+        import uvicorn
+        from fastapi_app.main import app
+
+        uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+def seed(database_url, rides, users, seed_value):
+    """
+    Create the schema and insert drivers, passengers and rides.
+    Returns (passenger ids, ride ids).
+    """
+    from sqlalchemy import create_engine
+    from app.extensions import db
+    from app.models.models import Ride, User, UserRole
+    from app.services.locations import index_location_keys
+
+    engine = create_engine(database_url)
+    db.Model.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(User.__table__.insert(), [
+            {'email': f'driver{i}@bench.test', 'password_hash': '!', 'role': UserRole.driver,
+             'is_active': True, 'is_email_verified': True}
+            for i in range(DRIVERS)
+        ])
+        connection.execute(User.__table__.insert(), [
+            {'email': f'passenger{i}@bench.test', 'password_hash': '!', 'role': UserRole.passenger,
+             'is_active': True, 'is_email_verified': True}
+            for i in range(users)
+        ])
+        rows = (dict(row, driver_id=1 + index % DRIVERS, status='active')
+                for index, row in enumerate(ride_rows(rides, seed=seed_value, start=_today())))
+        insert_in_chunks(connection, Ride.__table__, rows)
+        index_location_keys(connection)
+    engine.dispose()
+    return list(range(DRIVERS + 1, DRIVERS + users + 1)), list(range(1, rides + 1))
+
+def _today():
+    return datetime.combine(date.today(), datetime.min.time())
+
+def mint_tokens(stack, database_url, user_ids):
+    """
+    Access tokens for the passengers, signed the way each stack expects.
+    """
+    if stack == 'flask':
+        from flask_jwt_extended import create_access_token
+        from app import create_app
+
+        app = create_app(make_config(database_url))
+        with app.app_context():
+            # Flask-JWT-Extended 4.7 rejects subjects that are not strings
+            return [create_access_token(identity=str(user_id)) for user_id in user_ids]
+    from fastapi_app.api.auth import create_access_token
+
+    return [create_access_token({'sub': str(user_id)}) for user_id in user_ids]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'server on port {port} did not start')
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class VirtualUser:
+    """
+    One passenger running the weighted mix over a keep-alive connection.
+    """
+
+    def __init__(self, stack, port, token, mix, rng, stats):
+        self.stack = stack
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.ops = [name for name, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.rng = rng
+        self.stats = stats
+        self.found = []
+        self.pending = []
+
+    def request(self, endpoint, method, path, body=None, content_type=None):
+        headers = dict(self.headers)
+        if content_type:
+            headers['Content-Type'] = content_type
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            payload, status = b'', 0
+        self.stats.record(endpoint, (time.perf_counter() - started) * 1000, status)
+        return status, payload
+
+    def step(self):
+        op = self.rng.choices(self.ops, self.weights)[0]
+        if op == 'book' and not self.found:
+            op = 'search'
+        if op in ('confirm', 'cancel') and not self.pending:
+            op = 'history' if self.stack == 'flask' else 'book' if self.found else 'search'
+        if op == 'history' and self.stack != 'flask':
+            self.stats.skip(op)
+            return
+        getattr(self, op)()
+
+    def search(self):
+        origin, destination = self.rng.sample(CITIES, 2)
+        day = (date.today() + timedelta(days=self.rng.randrange(365))).isoformat()
+        if self.stack == 'flask':
+            path = '/rides/search?' + urlencode({'origin': origin, 'destination': destination, 'date': day})
+        else:
+            # FastAPI's date is a datetime lower bound, not a day
+            path = '/rides/?' + urlencode({'origin': origin, 'destination': destination, 'date': day + 'T00:00:00',
+                                           'limit': 20})
+        status, payload = self.request('search', 'GET', path)
+        if status == 200:
+            rides = [ride['id'] for ride in json.loads(payload)['rides'] if ride.get('id')]
+            self.found = (rides + self.found)[:50]
+
+    def book(self):
+        ride_id = self.found.pop(self.rng.randrange(len(self.found)))
+        if self.stack == 'flask':
+            self.request('book', 'POST', '/reservations/book', urlencode({'ride_id': ride_id}),
+                         'application/x-www-form-urlencoded')
+        else:
+            status, payload = self.request('book', 'POST', '/reservations/', json.dumps({'ride_id': ride_id}),
+                                           'application/json')
+            if status == 201:
+                self.pending.append(json.loads(payload)['id'])
+
+    def confirm(self):
+        self.request('confirm', 'POST', f'/reservations/confirm/{self.pending.pop()}')
+
+    def cancel(self):
+        self.request('cancel', 'POST', f'/reservations/cancel/{self.pending.pop()}')
+
+    def history(self):
+        status, payload = self.request('history', 'GET', '/profiles/me/rides?limit=50')
+        if status == 200:
+            self.pending = [
+                reservation['id'] for reservation in json.loads(payload)['reservations_as_passenger']
+                if reservation['status'] == 'pending'
+            ]
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recording = False
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.skipped = defaultdict(int)
+
+    def record(self, endpoint, elapsed_ms, status):
+        if not self.recording:
+            return
+        with self.lock:
+            self.samples[endpoint].append(elapsed_ms)
+            self.statuses[endpoint][status] += 1
+
+    def skip(self, endpoint):
+        if self.recording:
+            with self.lock:
+                self.skipped[endpoint] += 1
+
+    def report(self, elapsed):
+        endpoints = {}
+        for endpoint in ENDPOINTS:
+            samples = self.samples.get(endpoint)
+            if not samples:
+                if self.skipped.get(endpoint):
+                    endpoints[endpoint] = {'skipped': self.skipped[endpoint]}
+                continue
+            statuses = self.statuses[endpoint]
+            errors = sum(count for status, count in statuses.items() if status not in EXPECTED[endpoint])
+            endpoints[endpoint] = dict(
+                summarize(samples),
+                throughput_rps=round(len(samples) / elapsed, 1),
+                successes=sum(count for status, count in statuses.items() if 200 <= status < 400),
+                errors=errors,
+                error_rate=round(errors / len(samples), 4),
+                statuses={str(status): count for status, count in sorted(statuses.items())},
+            )
+        total = sum(len(samples) for samples in self.samples.values())
+        return {'requests': total, 'throughput_rps': round(total / elapsed, 1), 'endpoints': endpoints}
+
+def run_stack(stack, args, mix):
+    workdir = tempfile.mkdtemp(prefix=f'onygoo-load-{stack}-')
+    database_url = 'sqlite:///' + os.path.join(workdir, 'load.db')
+    passengers, _ = seed(database_url, args.rides, args.concurrency, args.seed)
+    tokens = mint_tokens(stack, database_url, passengers)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', stack, database_url, str(port)],
+        env=dict(os.environ, DATABASE_URL=database_url)
+    )
+    try:
+        wait_for_port(port)
+        stats = Stats()
+        stop = threading.Event()
+        users = [
+            VirtualUser(stack, port, token, mix, random.Random(args.seed * 1000 + index), stats)
+            for index, token in enumerate(tokens)
+        ]
+
+        def loop(user):
+            while not stop.is_set():
+                user.step()
+
+        threads = [threading.Thread(target=loop, args=(user,), daemon=True) for user in users]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup)
+        stats.recording = True
+        started = time.perf_counter()
+        time.sleep(args.duration)
+        stats.recording = False
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+        return stats.report(elapsed)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def failures(results, mix, max_error_rate):
+    """
+    Endpoints of the mix that never succeeded or whose error rate is above
+    max_error_rate: their latencies do not measure the real work.
+    """
+    found = []
+    for stack, result in results['stacks'].items():
+        for endpoint, _ in mix:
+            current = result['endpoints'].get(endpoint, {})
+            if 'skipped' in current:
+                continue
+            if not current.get('successes'):
+                found.append(f"{stack} {endpoint}: no successful requests ({current.get('statuses', {})})")
+            elif current['error_rate'] > max_error_rate:
+                found.append(f"{stack} {endpoint}: error rate {current['error_rate']:.2%} ({current['statuses']})")
+    return found
+
+def regressions(results, baseline, tolerance):
+    """
+    Endpoints whose p95 grew by more than tolerance relative to the baseline.
+    """
+    found = []
+    for stack, result in results['stacks'].items():
+        for endpoint, current in result['endpoints'].items():
+            previous = baseline.get('stacks', {}).get(stack, {}).get('endpoints', {}).get(endpoint, {})
+            if 'p95_ms' in current and previous.get('p95_ms'):
+                if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                    found.append(f"{stack} {endpoint}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+    return found
+
+def parse_mix(value):
+    mix = []
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'unknown endpoint {name}')
+        mix.append((name, float(weight or 1)))
+    return mix
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == '--serve':
+        return serve(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stacks', nargs='+', choices=['flask', 'fastapi'], default=['flask', 'fastapi'])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--rides', type=int, default=20000)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('search=60,book=15,confirm=8,cancel=7,history=10'))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    results = {
+        'benchmark': 'load_test',
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'rides': args.rides,
+        'mix': dict(args.mix),
+        'seed': args.seed,
+        'stacks': {stack: run_stack(stack, args, args.mix) for stack in args.stacks},
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+    found = failures(results, args.mix, args.max_error_rate)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found += regressions(results, json.load(f), args.tolerance)
+    if found:
+        raise SystemExit('load test failed:\n' + '\n'.join(found))
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,16 @@ from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel, EmailStr, constr
 from typing import Optional
 from datetime import datetime, timedelta
-from fastapi_sqlalchemy import db
-from app.models.models import User, Role
-from app.extensions import jwt
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi_app.db import get_db
+from app.models.models import User, UserRole
+from app.extensions import jwt, password_hasher
+from app.services.hashing import HashingQueueFull
 from jose import JWTError, jwt as jose_jwt
-from passlib.context import CryptContext
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
@@ -26,12 +26,6 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
@@ -40,31 +34,45 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-def register(user: UserCreate):
+async def register(user: UserCreate, session: AsyncSession = Depends(get_db)):
     """
     Register a new user with email, password, and role.
     """
-    existing_user = db.session.query(User).filter(User.email == user.email).first()
+    existing_user = (await session.execute(select(User.id).where(User.email == user.email))).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    role_obj = db.session.query(Role).filter(Role.name == user.role).first()
-    if not role_obj:
+    try:
+        role = UserRole(user.role)
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid role")
-    hashed_password = get_password_hash(user.password)
-    new_user = User(email=user.email, password_hash=hashed_password, role=role_obj)
-    db.session.add(new_user)
-    db.session.commit()
+    try:
+        hashed_password = await password_hasher.hash_async(user.password)
+    except HashingQueueFull:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    new_user = User(email=user.email, password_hash=hashed_password, role=role)
+    session.add(new_user)
+    await session.commit()
     # TODO: Send email verification asynchronously
     return {"msg": "User registered. Please verify your email."}
 
 @router.post("/login", response_model=Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_db)):
     """
     User login with email and password. Returns JWT access token.
     """
-    user = db.session.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+    user = (await session.execute(select(User).where(User.email == form_data.username))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        matches, new_hash = await password_hasher.verify_async(form_data.password, user.password_hash)
+    except HashingQueueFull:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    if not matches:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Cost factor changed since this hash was written
+        user.password_hash = new_hash
+        await session.commit()
     if not user.is_email_verified:
         raise HTTPException(status_code=403, detail="Email not verified")
     access_token = create_access_token(data={"sub": str(user.id)})
@@ -0,0 +1,44 @@
+from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError, jwt as jose_jwt
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi_app.db import get_db
+from fastapi_app.api.auth import SECRET_KEY, ALGORITHM
+from app.models.models import User
+from app.extensions import identity_cache
+from app.services.identity import CurrentUser, snapshot_user
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_db)) -> CurrentUser:
+    """
+    Resolve the bearer token to the active user who owns it.
+    Decoded claims and the user row are served from identity_cache when
+    possible, so a warm request costs neither a JWT decode nor a query.
+    """
+    claims = identity_cache.get_claims(token)
+    if claims is None:
+        try:
+            claims = jose_jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            raise credentials_exception
+        if "sub" not in claims:
+            raise credentials_exception
+        identity_cache.set_claims(token, claims)
+    user_id = int(claims["sub"])
+    user = identity_cache.get_user(user_id)
+    if user is None:
+        row = await session.get(User, user_id)
+        if not row:
+            raise credentials_exception
+        user = snapshot_user(row)
+        identity_cache.set_user(user)
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
+    return user
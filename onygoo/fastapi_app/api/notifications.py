@@ -1,14 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import Response
 from pydantic import BaseModel, constr
 from typing import List, Optional
-from fastapi_sqlalchemy import db
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi_app.db import get_db, get_read_db
 from app.models.models import Notification, User
-from fastapi.security import OAuth2PasswordBearer
+from app.services.notifications import (
+    NOTIFICATION_COLUMNS, NOTIFICATION_FIELDS, UserNotFound, adjust_unread_statement, mark_read_statement, notify_async
+)
+from app.services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, apply_keyset, paginate
+from app.services.serialization import dumps, records
+from fastapi_app.api.deps import get_current_user
+from app.services.identity import CurrentUser
 
 router = APIRouter()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-
 class NotificationCreate(BaseModel):
     title: constr(max_length=255)
     message: constr(max_length=1000)
@@ -18,34 +26,96 @@ class NotificationResponse(BaseModel):
     id: int
     title: str
     message: str
-    user_id: Optional[int]
-    created_at: str
+    user_id: int
+    is_read: bool
+    created_at: datetime
 
     class Config:
         orm_mode = True
 
+class NotificationPage(BaseModel):
+    notifications: List[NotificationResponse]
+    next_cursor: Optional[str]
+
+class UnreadCount(BaseModel):
+    unread_count: int
+
+def _target_user_id(user_id, current_user):
+    if user_id is None or user_id == current_user.id:
+        return current_user.id
+    if current_user.role.name != 'admin':
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return user_id
+
 @router.post("/", response_model=NotificationResponse, status_code=status.HTTP_201_CREATED)
-def create_notification(notification: NotificationCreate, token: str = Depends(oauth2_scheme)):
-    """
-    Create a notification for a user or broadcast.
-    """
-    # Authentication and authorization logic here
-    new_notification = Notification(
-        title=notification.title,
-        message=notification.message,
-        user_id=notification.user_id
-    )
-    db.session.add(new_notification)
-    db.session.commit()
+async def create_notification(notification: NotificationCreate, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Create a notification for a user (the current user if user_id is omitted).
+    Only admins may notify other users.
+    """
+    user_id = _target_user_id(notification.user_id, current_user)
+    try:
+        new_notification = await notify_async(session, user_id, notification.title, notification.message)
+    except UserNotFound:
+        raise HTTPException(status_code=404, detail="User not found")
+    await session.commit()
     return new_notification
 
-@router.get("/", response_model=List[NotificationResponse])
-def get_notifications(user_id: Optional[int] = None, token: str = Depends(oauth2_scheme)):
+@router.get("/", response_model=NotificationPage)
+async def get_notifications(
+    user_id: Optional[int] = None,
+    unread_only: bool = False,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_read_db)
+):
+    """
+    Get the inbox of the current user (or of user_id, for admins), newest first.
+    Pass next_cursor back as cursor to get the following page.
+    Encoded from column tuples; response_model only documents the shape.
+    """
+    user_id = _target_user_id(user_id, current_user)
+    statement = select(*NOTIFICATION_COLUMNS).where(Notification.user_id == user_id)
+    if unread_only:
+        statement = statement.where(Notification.is_read.is_(False))
+    try:
+        statement = apply_keyset(statement, Notification.created_at, Notification.id, cursor, limit, descending=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    notifications, next_cursor = paginate(await session.execute(statement), limit, 'created_at')
+    body = dumps({"notifications": records(NOTIFICATION_FIELDS, notifications), "next_cursor": next_cursor})
+    return Response(body, media_type="application/json")
+
+@router.get("/unread_count", response_model=UnreadCount)
+async def get_unread_count(current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Number of unread notifications of the current user, for the app badge.
+    Reads the maintained counter instead of counting the inbox.
+    """
+    count = (await session.execute(
+        select(User.unread_notifications).where(User.id == current_user.id)
+    )).scalar_one()
+    return {"unread_count": count}
+
+@router.post("/{notification_id}/read", response_model=UnreadCount)
+async def mark_notification_read(notification_id: int, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Mark one notification of the current user as read.
+    """
+    flipped = (await session.execute(mark_read_statement(current_user.id, notification_id))).rowcount
+    if flipped:
+        await session.execute(adjust_unread_statement(current_user.id, -flipped))
+    await session.commit()
+    return await get_unread_count(current_user, session)
+
+@router.post("/read_all", response_model=UnreadCount)
+async def mark_all_notifications_read(current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """
-    Get notifications for a user or all if no user_id provided.
+    Mark every notification of the current user as read.
     """
-    query = db.session.query(Notification)
-    if user_id:
-        query = query.filter(Notification.user_id == user_id)
-    notifications = query.all()
-    return notifications
+    flipped = (await session.execute(mark_read_statement(current_user.id))).rowcount
+    if flipped:
+        await session.execute(adjust_unread_statement(current_user.id, -flipped))
+    await session.commit()
+    return await get_unread_count(current_user, session)
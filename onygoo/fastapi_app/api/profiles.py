@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, EmailStr, constr
 from typing import Optional
-from fastapi_sqlalchemy import db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi_app.db import get_db
 from app.models.models import User, Profile
-from fastapi.security import OAuth2PasswordBearer
+from fastapi_app.api.deps import get_current_user
+from app.services.identity import CurrentUser
 
 router = APIRouter()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-
 class ProfileBase(BaseModel):
     full_name: Optional[constr(max_length=100)]
     phone_number: Optional[constr(max_length=20)]
@@ -22,31 +23,30 @@ class ProfileResponse(ProfileBase):
         orm_mode = True
 
 @router.get("/me", response_model=ProfileResponse)
-def get_my_profile(token: str = Depends(oauth2_scheme)):
+async def get_my_profile(photo_size: Optional[int] = None, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """
     Get the profile of the current logged-in user.
+    photo_url points at the thumbnail closest to photo_size pixels when given.
     """
-    # Decode token to get user id (implementation depends on JWT setup)
-    user_id = int(token)  # Placeholder, replace with actual decoding
-    user = db.session.query(User).filter(User.id == user_id).first()
-    if not user or not user.profile:
+    user_id = current_user.id
+    profile = (await session.execute(select(Profile).where(Profile.user_id == user_id))).scalars().first()
+    if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
-    return user.profile
+    return ProfileResponse.from_orm(profile).copy(update={"photo_url": profile.photo_variant_url(photo_size)})
 
 @router.put("/me", response_model=ProfileResponse)
-def update_my_profile(profile: ProfileBase, token: str = Depends(oauth2_scheme)):
+async def update_my_profile(profile: ProfileBase, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """
     Update the profile of the current logged-in user.
     """
-    user_id = int(token)  # Placeholder, replace with actual decoding
-    user = db.session.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    if not user.profile:
-        user.profile = Profile()
+    user_id = current_user.id
+    user_profile = (await session.execute(select(Profile).where(Profile.user_id == user_id))).scalars().first()
+    if not user_profile:
+        user_profile = Profile(user_id=user_id)
+        session.add(user_profile)
     if profile.full_name is not None:
-        user.profile.full_name = profile.full_name
+        user_profile.full_name = profile.full_name
     if profile.phone_number is not None:
-        user.profile.phone_number = profile.phone_number
-    db.session.commit()
-    return user.profile
+        user_profile.phone_number = profile.phone_number
+    await session.commit()
+    return user_profile
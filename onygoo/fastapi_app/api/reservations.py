@@ -1,63 +1,74 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel, conint
-from typing import List
-from fastapi_sqlalchemy import db
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi_app.db import get_db
 from app.models.models import Reservation, Ride, User, ReservationStatus
-from fastapi.security import OAuth2PasswordBearer
+from app.extensions import search_cache
+from app.services.recurring import materialize_async, OccurrenceNotFound
+from app.services.seats import reserve_seat_async, cancel_reservation_async, AlreadyBooked, AlreadyCancelled, NoSeatsAvailable
+from fastapi_app.api.deps import get_current_user
+from app.services.identity import CurrentUser
 
 router = APIRouter()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-
 class ReservationCreate(BaseModel):
-    ride_id: conint(gt=0)
+    # Either ride_id, or template_id and departure_time for an occurrence of a recurring ride
+    ride_id: Optional[conint(gt=0)]
+    template_id: Optional[conint(gt=0)]
+    departure_time: Optional[datetime]
 
 class ReservationResponse(BaseModel):
     id: int
     passenger_id: int
     ride_id: int
-    status: str
+    status: ReservationStatus
 
     class Config:
         orm_mode = True
 
 @router.post("/", response_model=ReservationResponse, status_code=status.HTTP_201_CREATED)
-def book_seat(reservation: ReservationCreate, token: str = Depends(oauth2_scheme)):
+async def book_seat(reservation: ReservationCreate, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """
-    Book a seat on a ride by a passenger.
+    Book a seat on a ride by a passenger, or on an occurrence of a recurring
+    ride as listed by search.
     """
-    user_id = int(token)  # Placeholder, replace with actual decoding
-    user = db.session.query(User).filter(User.id == user_id).first()
-    if not user or user.role.name != 'passenger':
+    user_id = current_user.id
+    if current_user.role.name != 'passenger':
         raise HTTPException(status_code=403, detail="Only passengers can book seats")
-    ride = db.session.query(Ride).filter(Ride.id == reservation.ride_id, Ride.status == 'active').first()
+    ride_id = reservation.ride_id
+    if ride_id is None:
+        if reservation.template_id is None or reservation.departure_time is None:
+            raise HTTPException(status_code=422, detail="ride_id or template_id and departure_time are required")
+        try:
+            # The occurrence becomes a real ride in the booking transaction
+            ride_id = await materialize_async(session, reservation.template_id, reservation.departure_time)
+        except OccurrenceNotFound:
+            raise HTTPException(status_code=404, detail="Ride not available")
+    ride = (await session.execute(
+        select(Ride).where(Ride.id == ride_id, Ride.status == 'active')
+    )).scalars().first()
     if not ride:
         raise HTTPException(status_code=404, detail="Ride not available")
-    if ride.seats_available < 1:
-        raise HTTPException(status_code=400, detail="No seats available")
-    existing_reservation = db.session.query(Reservation).filter(
-        Reservation.passenger_id == user_id,
-        Reservation.ride_id == reservation.ride_id
-    ).first()
-    if existing_reservation:
+    scope = search_cache.scope_of(ride)
+    try:
+        new_reservation = await reserve_seat_async(session, user_id, ride_id)
+    except AlreadyBooked:
         raise HTTPException(status_code=400, detail="Already booked this ride")
-    new_reservation = Reservation(
-        passenger_id=user_id,
-        ride_id=reservation.ride_id,
-        status=ReservationStatus.pending
-    )
-    ride.seats_available -= 1
-    db.session.add(new_reservation)
-    db.session.commit()
+    except NoSeatsAvailable:
+        raise HTTPException(status_code=400, detail="No seats available")
+    search_cache.invalidate(scope)
     return new_reservation
 
 @router.post("/confirm/{reservation_id}")
-def confirm_reservation(reservation_id: int, token: str = Depends(oauth2_scheme)):
+async def confirm_reservation(reservation_id: int, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """
     Confirm a reservation (simulate payment).
     """
-    user_id = int(token)  # Placeholder, replace with actual decoding
-    reservation = db.session.query(Reservation).filter(Reservation.id == reservation_id).first()
+    user_id = current_user.id
+    reservation = await session.get(Reservation, reservation_id)
     if not reservation:
         raise HTTPException(status_code=404, detail="Reservation not found")
     if reservation.passenger_id != user_id:
@@ -66,23 +77,24 @@ def confirm_reservation(reservation_id: int, token: str = Depends(oauth2_scheme)
         raise HTTPException(status_code=400, detail="Reservation not pending")
     # Simulate payment logic here
     reservation.status = ReservationStatus.confirmed
-    db.session.commit()
+    await session.commit()
     return {"msg": "Reservation confirmed and payment completed"}
 
 @router.post("/cancel/{reservation_id}")
-def cancel_reservation(reservation_id: int, token: str = Depends(oauth2_scheme)):
+async def cancel_reservation(reservation_id: int, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """
     Cancel a reservation.
     """
-    user_id = int(token)  # Placeholder, replace with actual decoding
-    reservation = db.session.query(Reservation).filter(Reservation.id == reservation_id).first()
+    user_id = current_user.id
+    reservation = await session.get(Reservation, reservation_id)
     if not reservation:
         raise HTTPException(status_code=404, detail="Reservation not found")
     if reservation.passenger_id != user_id:
         raise HTTPException(status_code=403, detail="Unauthorized")
-    if reservation.status == ReservationStatus.cancelled:
+    scope = search_cache.scope_of(await session.get(Ride, reservation.ride_id))
+    try:
+        await cancel_reservation_async(session, reservation)
+    except AlreadyCancelled:
         raise HTTPException(status_code=400, detail="Reservation already cancelled")
-    reservation.status = ReservationStatus.cancelled
-    reservation.ride.seats_available += 1
-    db.session.commit()
+    search_cache.invalidate(scope)
     return {"msg": "Reservation cancelled successfully"}
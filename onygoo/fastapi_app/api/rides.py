@@ -1,70 +1,288 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from pydantic import BaseModel, constr, conint, confloat
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
-from fastapi_sqlalchemy import db
-from app.models.models import Ride, User
-from fastapi.security import OAuth2PasswordBearer
+from datetime import date as date_type, datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from fastapi_app.db import async_session, get_db, get_read_db
+from app.models.models import Ride, RideTemplate, RideTemplateException, User
+from app.extensions import search_cache, geo_index
+from app.services.locations import location_key_filter, location_keys_async, normalize_location
+from app.services.querywatch import query_budget
+from app.services.ride_import import RideBase, aiter_lines, import_format, import_rides_async
+from app.services.recurring import (
+    RIDE_COLUMNS, RideTemplateBase, amerge_rides, merge_rides, ride_record, search_occurrences_async, search_window,
+    weekday_list, weekday_mask
+)
+from app.services.serialization import dumps
+from fastapi_app.settings import settings
+from app.services.pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_CHUNK_SIZE, aiter_json_array, apply_keyset, paginate
+)
+from fastapi_app.api.deps import get_current_user
+from app.services.identity import CurrentUser
 
 router = APIRouter()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
-
-class RideBase(BaseModel):
-    origin: constr(max_length=255)
-    destination: constr(max_length=255)
-    departure_time: datetime
-    seats_available: conint(gt=0)
-    price_per_seat: confloat(ge=0)
-
 class RideCreate(RideBase):
     pass
 
 class RideResponse(RideBase):
-    id: int
+    # id is null for occurrences of recurring rides, identified by template_id and departure_time
+    id: Optional[int]
     driver_id: int
     status: str
+    template_id: Optional[int]
 
     class Config:
         orm_mode = True
 
+class RideSearchPage(BaseModel):
+    rides: List[RideResponse]
+    next_cursor: Optional[str]
+
 @router.post("/", response_model=RideResponse, status_code=status.HTTP_201_CREATED)
-def propose_ride(ride: RideCreate, token: str = Depends(oauth2_scheme)):
+async def propose_ride(ride: RideCreate, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
     """
     Propose a new ride by a driver.
     """
-    user_id = int(token)  # Placeholder, replace with actual decoding
-    user = db.session.query(User).filter(User.id == user_id).first()
-    if not user or user.role.name != 'driver':
+    if current_user.role.name != 'driver':
         raise HTTPException(status_code=403, detail="Only drivers can propose rides")
     new_ride = Ride(
-        driver_id=user.id,
+        driver_id=current_user.id,
         origin=ride.origin,
         destination=ride.destination,
         departure_time=ride.departure_time,
         seats_available=ride.seats_available,
         price_per_seat=ride.price_per_seat,
+        origin_lat=ride.origin_lat,
+        origin_lon=ride.origin_lon,
+        destination_lat=ride.destination_lat,
+        destination_lon=ride.destination_lon,
         status='active'
     )
-    db.session.add(new_ride)
-    db.session.commit()
+    session.add(new_ride)
+    await session.commit()
+    search_cache.invalidate(search_cache.scope_of(new_ride))
+    geo_index.put(new_ride.id, geo_index.entry_of(new_ride))
     return new_ride
 
-@router.get("/", response_model=List[RideResponse])
-def search_rides(
+class NearbyRideResponse(RideResponse):
+    origin_distance_km: float
+    destination_distance_km: float
+
+class NearbyRides(BaseModel):
+    rides: List[NearbyRideResponse]
+
+@router.get("/nearby", response_model=NearbyRides)
+@query_budget(3)
+async def search_nearby_rides(
+    origin_lat: float = Query(..., ge=-90, le=90),
+    origin_lon: float = Query(..., ge=-180, le=180),
+    destination_lat: float = Query(..., ge=-90, le=90),
+    destination_lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(5, gt=0, le=settings['GEO_MAX_RADIUS_KM']),
+    date_from: Optional[datetime] = Query(None, alias="from"),
+    date_to: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_db)
+):
+    """
+    Search for rides leaving within radius_km of the origin and arriving
+    within radius_km of the destination, ordered by departure time.
+    Only rides proposed with coordinates are found.
+    """
+    await geo_index.ensure_loaded_async(session)
+    matches = geo_index.search(
+        (origin_lat, origin_lon), (destination_lat, destination_lon), radius_km,
+        date_from or datetime.utcnow(), date_to
+    )[:limit]
+    if not matches:
+        return {"rides": []}
+    # The index may lag other processes: the database has the final say
+    rides = {ride.id: ride for ride in (await session.execute(
+        select(Ride).where(Ride.id.in_([ride_id for ride_id, _, _ in matches]), Ride.status == 'active')
+    )).scalars()}
+    return {"rides": [
+        dict(rides[ride_id].to_dict(), origin_distance_km=origin_km, destination_distance_km=destination_km)
+        for ride_id, origin_km, destination_km in matches if ride_id in rides
+    ]}
+
+class RideImportError(BaseModel):
+    line: int
+    error: str
+
+class RideImportReport(BaseModel):
+    imported: int
+    rejected: int
+    errors: List[RideImportError]
+
+@router.post("/import", response_model=RideImportReport)
+async def import_rides_bulk(
+    request: Request,
+    format: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_db)
+):
+    """
+    Bulk import rides of the current driver from a CSV (with header) or
+    NDJSON body, one ride per line. The body is streamed and inserted in
+    one transaction; invalid lines are reported and skipped.
+    """
+    if current_user.role.name != 'driver':
+        raise HTTPException(status_code=403, detail="Only drivers can propose rides")
+    fmt = import_format(request.headers.get('content-type'), format)
+    if fmt not in ('csv', 'ndjson'):
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+    report = await import_rides_async(session, current_user.id, aiter_lines(request.stream()), fmt)
+    await session.commit()
+    if report['imported']:
+        # Too many scopes to invalidate one by one
+        search_cache.clear()
+        geo_index.invalidate()
+    return report
+
+async def _stream_rides(statement, occurrences):
+    # The request session may be closed before the body is sent, so streaming uses its own
+    async with async_session() as session:
+        result = await session.stream(statement.execution_options(yield_per=STREAM_CHUNK_SIZE))
+        rows = amerge_rides(result, occurrences)
+        async for chunk in aiter_json_array(rows, ride_record):
+            yield chunk
+
+@router.get("/", response_model=RideSearchPage)
+@query_budget(5)
+async def search_rides(
     origin: Optional[str] = Query(None, max_length=255),
     destination: Optional[str] = Query(None, max_length=255),
-    date: Optional[datetime] = None
+    date: Optional[datetime] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    session: AsyncSession = Depends(get_read_db)
 ):
     """
     Search for rides by origin, destination, and optional date.
+    Results are keyset-paginated on (departure_time, id); pass next_cursor back
+    as cursor to get the following page, or stream=true to stream every match.
+    Upcoming occurrences of recurring rides are included with id null.
+    The page is encoded from column tuples directly; response_model only
+    documents its shape.
     """
-    query = db.session.query(Ride).filter(Ride.status == 'active')
-    if origin:
-        query = query.filter(Ride.origin.ilike(f"%{origin}%"))
-    if destination:
-        query = query.filter(Ride.destination.ilike(f"%{destination}%"))
+    if not stream:
+        # None (any location) must not share entries with '' (matches nothing)
+        cache_key = search_cache.make_key(
+            origin and normalize_location(origin), destination and normalize_location(destination),
+            date, None, cursor, limit
+        )
+        body = search_cache.get(cache_key)
+        if body is not None:
+            return Response(body, media_type="application/json")
+    origin_keys, destination_keys = await location_keys_async(session, origin, destination)
+    statement = select(*RIDE_COLUMNS).where(Ride.status == 'active')
+    if origin_keys is not None:
+        statement = statement.where(location_key_filter(Ride.origin_key, origin_keys))
+    if destination_keys is not None:
+        statement = statement.where(location_key_filter(Ride.destination_key, destination_keys))
     if date:
-        query = query.filter(Ride.departure_time >= date)
-    rides = query.all()
-    return rides
+        statement = statement.where(Ride.departure_time >= date)
+    try:
+        statement = apply_keyset(statement, Ride.departure_time, Ride.id, cursor, None if stream else limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Recurring rides are expanded in the searched window and merged in departure order
+    start, end = search_window(date, None, settings['RECURRING_SEARCH_DAYS'])
+    occurrences = await search_occurrences_async(
+        session, origin_keys, destination_keys, start, end, cursor, None if stream else limit
+    )
+    if stream:
+        return StreamingResponse(_stream_rides(statement, occurrences), media_type="application/json")
+    rides, next_cursor = paginate(merge_rides(await session.execute(statement), occurrences), limit, 'departure_time')
+    body = dumps({"rides": [ride_record(ride) for ride in rides], "next_cursor": next_cursor})
+    search_cache.set(cache_key, body)
+    return Response(body, media_type="application/json")
+
+class RideTemplateResponse(RideTemplateBase):
+    id: int
+    status: str
+    exceptions: List[date_type]
+
+class RideTemplateExceptionCreate(BaseModel):
+    date: date_type
+
+def _template_response(template):
+    return RideTemplateResponse(
+        id=template.id,
+        origin=template.origin,
+        destination=template.destination,
+        departure_time=template.departure_time,
+        weekdays=weekday_list(template.weekdays),
+        valid_from=template.valid_from,
+        valid_until=template.valid_until,
+        seats_available=template.seats_available,
+        price_per_seat=template.price_per_seat,
+        status=template.status,
+        exceptions=sorted(exception.date for exception in template.exceptions)
+    )
+
+async def _own_template(session, template_id, current_user):
+    template = (await session.execute(
+        select(RideTemplate).options(selectinload(RideTemplate.exceptions)).where(RideTemplate.id == template_id)
+    )).scalars().first()
+    if not template:
+        raise HTTPException(status_code=404, detail="Ride template not found")
+    if template.driver_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    return template
+
+@router.post("/templates", response_model=RideTemplateResponse, status_code=status.HTTP_201_CREATED)
+async def create_ride_template(template: RideTemplateBase, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Create a recurring ride (weekdays: Monday = 0).
+    """
+    if current_user.role.name != 'driver':
+        raise HTTPException(status_code=403, detail="Only drivers can propose rides")
+    new_template = RideTemplate(
+        driver_id=current_user.id,
+        origin=template.origin,
+        destination=template.destination,
+        departure_time=template.departure_time,
+        weekdays=weekday_mask(template.weekdays),
+        valid_from=template.valid_from,
+        valid_until=template.valid_until,
+        seats_available=template.seats_available,
+        price_per_seat=template.price_per_seat,
+        status='active',
+        exceptions=[]
+    )
+    session.add(new_template)
+    await session.commit()
+    # A template touches every date of its range, so scoped invalidation does not pay off
+    search_cache.clear()
+    return _template_response(await _own_template(session, new_template.id, current_user))
+
+@router.post("/templates/{template_id}/exceptions", response_model=RideTemplateResponse)
+async def add_ride_template_exception(template_id: int, exception: RideTemplateExceptionCreate, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Skip one date of a recurring ride.
+    """
+    template = await _own_template(session, template_id, current_user)
+    if exception.date not in {existing.date for existing in template.exceptions}:
+        template.exceptions.append(RideTemplateException(date=exception.date))
+        await session.commit()
+        search_cache.clear()
+        template = await _own_template(session, template_id, current_user)
+    return _template_response(template)
+
+@router.delete("/templates/{template_id}")
+async def cancel_ride_template(template_id: int, current_user: CurrentUser = Depends(get_current_user), session: AsyncSession = Depends(get_db)):
+    """
+    Stop a recurring ride. Occurrences already booked stay as regular rides.
+    """
+    template = await _own_template(session, template_id, current_user)
+    template.status = 'cancelled'
+    await session.commit()
+    search_cache.clear()
+    return {"msg": "Ride template cancelled successfully"}
@@ -0,0 +1,42 @@
+import asyncio
+from fastapi import Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from fastapi_app.settings import settings
+from app.extensions import replicas
+from app.services.database import make_engine
+from app.services.replicas import PRIMARY_COOKIE
+
+# Same DB_* pool settings as the Flask app (see app.services.database)
+engine = make_engine(settings, 'fastapi', asynchronous=True)
+async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+replicas.configure(settings)
+replica_engines = [
+    make_engine(dict(settings, SQLALCHEMY_DATABASE_URI=url), f'fastapi-replica-{number}', asynchronous=True)
+    for number, url in enumerate(replicas.urls)
+]
+
+async def get_db(request: Request):
+    """
+    FastAPI dependency yielding an AsyncSession for the duration of a request.
+    """
+    async with async_session() as session:
+        # Lets a write set the read-after-write cookie (PrimaryCookieMiddleware)
+        session.sync_session.info['asgi_scope'] = request.scope
+        yield session
+
+async def get_read_db(request: Request):
+    """
+    get_db for read-only endpoints: reads go to a replica within the lag
+    guard, unless this client wrote recently.
+    """
+    async with async_session() as session:
+        session.sync_session.info['asgi_scope'] = request.scope
+        if replica_engines:
+            if replicas.stale():
+                await asyncio.to_thread(replicas.refresh_lag)
+            replica = replicas.choose(replica_engines, request.cookies.get(PRIMARY_COOKIE))
+            if replica is not None:
+                session.sync_session.info['replica'] = replica.sync_engine
+        yield session
@@ -0,0 +1,4 @@
+from config import DevelopmentConfig
+
+# Same settings the Flask app loads through app.config.from_object
+settings = {key: getattr(DevelopmentConfig, key) for key in dir(DevelopmentConfig) if key.isupper()}
@@ -0,0 +1,24 @@
+import pytest
+
+from app import create_app
+from app.extensions import db, geo_index, search_cache
+from config import TestingConfig
+
+class QueryBudgetConfig(TestingConfig):
+    ASSETS_BUILD_ON_STARTUP = False
+
+@pytest.fixture
+def app():
+    app = create_app(QueryBudgetConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+    # Module-level singletons outlive the app
+    search_cache.clear()
+    geo_index.invalidate()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db
+from app.models.models import Ride, User, UserRole
+
+@pytest.fixture
+def ride(app):
+    driver = User(email='driver@example.com', password_hash='x', role=UserRole.driver)
+    ride = Ride(
+        driver=driver, origin='Saint-Étienne (Gare)', destination='Lyon Part-Dieu',
+        departure_time=datetime.utcnow() + timedelta(days=1), seats_available=3, price_per_seat=12.0,
+    )
+    db.session.add(ride)
+    db.session.commit()
+    return ride
+
+@pytest.mark.parametrize('origin, destination, found', [
+    ('saint eti', 'lyon', 1),
+    ('Étienne', 'part', 1),
+    ('gare', 'LYON PART-DIEU', 1),
+    ('tienne', 'lyon', 0),
+    ('--', 'lyon', 0),
+])
+def test_search_matches_token_prefixes(client, ride, origin, destination, found):
+    response = client.get('/rides/search', query_string={'origin': origin, 'destination': destination})
+    assert response.status_code == 200
+    assert len(response.get_json()['rides']) == found
+
+def test_search_finds_renamed_ride(client, ride):
+    ride.origin = 'Grenoble'
+    db.session.commit()
+    response = client.get('/rides/search', query_string={'origin': 'gren', 'destination': 'lyon'})
+    assert [found['id'] for found in response.get_json()['rides']] == [ride.id]
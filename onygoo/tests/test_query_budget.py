@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.extensions import db, query_watch
+from app.models.models import Ride, User, UserRole
+from app.services.querywatch import QueryBudgetExceeded, query_budget
+
+RIDES = 20
+
+@pytest.fixture
+def rides(app):
+    departure = datetime.utcnow() + timedelta(days=1)
+    drivers = [
+        User(email=f'driver{number}@example.com', password_hash='x', role=UserRole.driver)
+        for number in range(RIDES)
+    ]
+    db.session.add_all(drivers)
+    db.session.add_all([
+        Ride(
+            driver=driver, origin='Paris', destination='Lyon',
+            departure_time=departure + timedelta(minutes=number),
+            seats_available=3, price_per_seat=20.0,
+            origin_lat=48.8566, origin_lon=2.3522, destination_lat=45.764, destination_lon=4.8357,
+        )
+        for number, driver in enumerate(drivers)
+    ])
+    db.session.commit()
+    return departure
+
+def test_search_stays_within_budget(client, rides):
+    response = client.get('/rides/search', query_string={'origin': 'Paris', 'destination': 'Lyon', 'limit': 50})
+    assert response.status_code == 200
+    assert len(response.get_json()['rides']) == RIDES
+    assert query_watch.last.count <= 5
+
+def test_nearby_stays_within_budget(client, rides):
+    response = client.get('/rides/nearby', query_string={
+        'origin_lat': 48.85, 'origin_lon': 2.35, 'destination_lat': 45.76, 'destination_lon': 4.83,
+        'from': (rides - timedelta(hours=1)).isoformat(),
+    })
+    assert response.status_code == 200
+    assert len(response.get_json()['rides']) == RIDES
+    assert query_watch.last.count <= 3
+
+def test_nplus1_over_budget_raises(app, client, rides):
+    @query_budget(5)
+    def drivers_of_rides():
+        # Lazy-loads each ride's driver: one SELECT per ride
+        return {'drivers': [ride.driver.email for ride in Ride.query.all()]}
+
+    app.add_url_rule('/test/drivers', 'drivers_of_rides', drivers_of_rides)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/test/drivers')
+    repeated = query_watch.last.repeated(app.config['QUERY_NPLUS1_THRESHOLD'])
+    assert [count for _, count, _ in repeated] == [RIDES]
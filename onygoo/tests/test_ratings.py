@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app.extensions import db
+from app.models.models import Reservation, ReservationStatus, Ride, User, UserRole
+
+@pytest.fixture
+def shared_ride(app):
+    driver = User(email='driver@example.com', password_hash='x', role=UserRole.driver)
+    passenger = User(email='passenger@example.com', password_hash='x', role=UserRole.passenger)
+    ride = Ride(
+        driver=driver, origin='Dakar', destination='Thiès', departure_time=datetime.utcnow() - timedelta(days=1),
+        seats_available=2, price_per_seat=5.0,
+    )
+    db.session.add_all([driver, passenger, ride])
+    db.session.flush()
+    db.session.add(Reservation(passenger_id=passenger.id, ride_id=ride.id, status=ReservationStatus.confirmed))
+    db.session.commit()
+    return driver, passenger, ride
+
+def rate(client, rater, ratee, ride, score):
+    headers = {'Authorization': f'Bearer {create_access_token(identity=str(rater.id))}'}
+    return client.post(f'/profiles/{ratee.id}/rating', json={'ride_id': ride.id, 'score': score}, headers=headers)
+
+def test_passenger_rates_driver(client, shared_ride):
+    driver, passenger, ride = shared_ride
+    assert rate(client, passenger, driver, ride, 4).status_code == 201
+    assert rate(client, passenger, driver, ride, 5).status_code == 409
+    assert client.get(f'/profiles/{driver.id}/rating').get_json() == {'rating': 4.0, 'rating_count': 1}
+
+def test_outsider_cannot_rate(client, shared_ride):
+    driver, _, ride = shared_ride
+    outsider = User(email='outsider@example.com', password_hash='x', role=UserRole.passenger)
+    db.session.add(outsider)
+    db.session.commit()
+    assert rate(client, outsider, driver, ride, 1).status_code == 403
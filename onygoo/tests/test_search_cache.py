@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta
+
+from app.services.cache import SearchCache
+
+def test_invalidate_drops_only_matching_searches():
+    cache = SearchCache()
+    day = datetime(2026, 1, 10)
+    keys = {
+        'same_day': cache.make_key('dakar', 'thies', day, day + timedelta(days=1)),
+        'other_day': cache.make_key('dakar', 'thies', day + timedelta(days=3), day + timedelta(days=4)),
+        'prefix_any_destination': cache.make_key('da', None),
+        'other_route': cache.make_key('lyon', 'paris'),
+    }
+    for key in keys.values():
+        cache.set(key, {'rides': []})
+
+    assert cache.invalidate(('dakar plateau', 'thies', day + timedelta(hours=5))) == 2
+    assert {name for name, key in keys.items() if cache.get(key) is not None} == {'other_day', 'other_route'}
+    assert set(cache.index.groups()) == {('dakar', 'thies'), ('lyon', 'paris')}
+
+def test_index_forgets_expired_keys():
+    cache = SearchCache(ttl=0)
+    cache.set(cache.make_key('dakar', 'thies'), {'rides': []})
+    assert cache.index.groups() == []